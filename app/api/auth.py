@@ -1,23 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..models import User, Merchant, UserRole
 from ..schemas import UserCreate, UserLogin, UserResponse, Token
-from ..auth import verify_password, get_password_hash, create_access_token, get_current_user
+from ..auth import create_access_token, get_current_user, password_hasher, invalidate_principal_async
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# bcrypt 在专用线程池中执行（见 auth/hashing.py），数据库访问使用异步会话
+
 @router.post("/register", response_model=UserResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username exists
-    if db.query(User).filter(User.username == user_data.username).first():
+    if (await db.execute(select(User.id).where(User.username == user_data.username))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already exists"
         )
 
     # Check if email exists
-    if db.query(User).filter(User.email == user_data.email).first():
+    if (await db.execute(select(User.id).where(User.email == user_data.email))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already exists"
@@ -29,7 +32,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         role = UserRole(role)
 
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -38,8 +41,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         balance=10000000.0
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.flush()
 
     # If merchant, create merchant record
     if role == UserRole.MERCHANT:
@@ -49,21 +51,34 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
             description=""
         )
         db.add(merchant)
-        db.commit()
 
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @router.post("/login", response_model=Token)
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_data.username).first()
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.username == user_data.username))
+    user = result.scalar_one_or_none()
 
-    if not user or not verify_password(user_data.password, user.password_hash):
+    if not user or not await password_hasher.verify(user_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # 哈希成本参数变化后，在登录时透明地升级密码哈希
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = await password_hasher.hash(user_data.password)
+        except HTTPException:
+            # 哈希线程池繁忙时跳过，下次登录再升级
+            pass
+        else:
+            await invalidate_principal_async(db, user.username)
+            await db.commit()
+
     access_token = create_access_token(data={"sub": user.username})
     return {
         "access_token": access_token,
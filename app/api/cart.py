@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, selectinload
+from datetime import datetime
 from ..database import get_db
 from ..models import Cart, CartItem, Product, User
-from ..schemas import CartItemCreate, CartItemUpdate, CartItemResponse, CartResponse
+from ..schemas import CartItemCreate, CartItemUpdate, CartItemResponse, CartResponse, CartBatch
 from ..auth import get_current_user
-from typing import List
+from ..services import idempotency
+from typing import Dict, List, Optional
 
 router = APIRouter(prefix="/cart", tags=["cart"])
 
+# 单次批量请求的行数上限
+MAX_BATCH_LINES = 200
+
 def get_or_create_cart(user: User, db: Session) -> Cart:
     """Get user's cart or create one if it doesn't exist"""
     cart = db.query(Cart).filter(Cart.user_id == user.id).first()
@@ -18,6 +25,44 @@ def get_or_create_cart(user: User, db: Session) -> Cart:
         db.refresh(cart)
     return cart
 
+def upsert_cart_id(user: User, db: Session) -> int:
+    """Id of the user's cart, created in the current transaction if missing"""
+    statement = insert(Cart).values(user_id=user.id, created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+    return db.execute(statement.on_conflict_do_update(
+        index_elements=[Cart.user_id],
+        set_={"updated_at": statement.excluded.updated_at},
+    ).returning(Cart.id)).scalar_one()
+
+def upsert_cart_items(db: Session, cart_id: int, quantities: Dict[int, int], accumulate: bool) -> None:
+    """Insert cart lines in one statement, adding to (or replacing) the quantity of existing ones"""
+    if not quantities:
+        return
+    now = datetime.utcnow()
+    statement = insert(CartItem).values([
+        {"cart_id": cart_id, "product_id": product_id, "quantity": quantity,
+         "created_at": now, "updated_at": now}
+        # 按商品 id 排序，并发写同一购物车的事务以相同顺序加锁
+        for product_id, quantity in sorted(quantities.items())
+    ])
+    quantity = CartItem.quantity + statement.excluded.quantity if accumulate else statement.excluded.quantity
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.product_id],
+        set_={"quantity": quantity, "updated_at": statement.excluded.updated_at},
+    ))
+
+def require_products(db: Session, product_ids) -> None:
+    """Raise 404 unless every product exists, with a single query"""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    found = set(db.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    missing = sorted(product_ids - found)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product not found: {', '.join(map(str, missing))}"
+        )
+
 @router.get("/", response_model=CartResponse)
 def get_cart(
     current_user: User = Depends(get_current_user),
@@ -30,44 +75,84 @@ def get_cart(
 @router.post("/items", response_model=CartItemResponse)
 def add_to_cart(
     item_data: CartItemCreate,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Add item to cart"""
+    # A retried request returns the first response instead of adding the quantity again
+    replay = idempotency.begin(db, current_user.id, idempotency_key, "POST /cart/items", item_data)
+    if replay is not None:
+        return replay
+
     # Verify product exists
-    product = db.query(Product).filter(Product.id == item_data.product_id).first()
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
+    require_products(db, [item_data.product_id])
 
-    # Get or create cart
-    cart = get_or_create_cart(current_user, db)
+    # Add to the existing line, or create it
+    cart_id = upsert_cart_id(current_user, db)
+    upsert_cart_items(db, cart_id, {item_data.product_id: item_data.quantity}, accumulate=True)
 
-    # Check if item already exists in cart
-    existing_item = db.query(CartItem).filter(
-        CartItem.cart_id == cart.id,
+    cart_item = db.query(CartItem).filter(
+        CartItem.cart_id == cart_id,
         CartItem.product_id == item_data.product_id
-    ).first()
+    ).one()
+    body = CartItemResponse.model_validate(cart_item).model_dump_json().encode("utf-8")
+    response = idempotency.complete(db, current_user.id, idempotency_key, body)
+    db.commit()
+    return response
 
-    if existing_item:
-        # Update quantity
-        existing_item.quantity += item_data.quantity
-        db.commit()
-        db.refresh(existing_item)
-        return existing_item
-    else:
-        # Create new cart item
-        cart_item = CartItem(
-            cart_id=cart.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity
+@router.post("/batch", response_model=CartResponse)
+def update_cart_batch(
+    batch: CartBatch,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Add, update and remove many cart lines in one transaction; returns the resulting cart"""
+    replay = idempotency.begin(db, current_user.id, idempotency_key, "POST /cart/batch", batch)
+    if replay is not None:
+        return replay
+
+    product_ids = [line.product_id for line in batch.add + batch.update] + batch.remove
+    if len(product_ids) > MAX_BATCH_LINES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_LINES} lines per batch"
         )
-        db.add(cart_item)
-        db.commit()
-        db.refresh(cart_item)
-        return cart_item
+    if len(set(product_ids)) != len(product_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each product may appear only once per batch"
+        )
+    if any(line.quantity <= 0 for line in batch.add) or any(line.quantity < 0 for line in batch.update):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Quantity must be greater than 0"
+        )
+
+    # 只校验要写入的商品；删除不存在的商品不算错误
+    require_products(db, [line.product_id for line in batch.add + batch.update])
+
+    cart_id = upsert_cart_id(current_user, db)
+    upsert_cart_items(db, cart_id, {line.product_id: line.quantity for line in batch.add}, accumulate=True)
+    upsert_cart_items(
+        db, cart_id, {line.product_id: line.quantity for line in batch.update if line.quantity > 0}, accumulate=False
+    )
+    removed = batch.remove + [line.product_id for line in batch.update if line.quantity == 0]
+    if removed:
+        db.execute(
+            delete(CartItem)
+            .where(CartItem.cart_id == cart_id, CartItem.product_id.in_(removed))
+            .execution_options(synchronize_session=False)
+        )
+
+    cart = db.query(Cart).options(
+        selectinload(Cart.items).selectinload(CartItem.product)
+    ).filter(Cart.id == cart_id).one()
+    body = CartResponse.model_validate(cart).model_dump_json().encode("utf-8")
+    response = idempotency.complete(db, current_user.id, idempotency_key, body)
+    db.commit()
+    return response
 
 @router.put("/items/{item_id}", response_model=CartItemResponse)
 def update_cart_item(
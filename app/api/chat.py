@@ -1,52 +1,174 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+import asyncio
+import json
+import re
+import unicodedata
+import httpx
+from typing import Optional, Tuple
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db, AsyncSessionLocal
 from ..models import Merchant, Product, ChatHistory, User, ProductStatus
 from ..schemas import ChatRequest, ChatResponse
 from ..auth import get_current_user
-from ..services.deepseek_service import deepseek_service
+from ..config import settings
+from ..services.catalog import get_cached_product_index, cache_product_index
+from ..services.product_retrieval import ProductEntry, ProductIndex
+from ..services.chat_memory import ChatMemory, load_memory, compact_memory, reset_memory
+from ..services.deepseek_service import deepseek_service, DeepSeekUnavailable, UNAVAILABLE_MESSAGE
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-@router.post("/", response_model=ChatResponse)
-async def chat_with_merchant(
-    chat_request: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+async def prepare_product_context(db: AsyncSession, merchant_id: int, message: str) -> Tuple[Merchant, str]:
     # Get merchant
-    merchant = db.query(Merchant).filter(Merchant.id == chat_request.merchant_id).first()
+    result = await db.execute(select(Merchant).where(Merchant.id == merchant_id))
+    merchant = result.scalar_one_or_none()
     if not merchant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Merchant not found"
         )
 
-    # Get merchant's online products
-    products = db.query(Product).filter(
-        Product.merchant_id == merchant.id,
-        Product.status == ProductStatus.ONLINE
-    ).all()
+    # 目录版本未变时直接复用检索索引
+    index = get_cached_product_index(merchant)
+    if index is None:
+        # Get merchant's online products
+        result = await db.execute(
+            select(Product.id, Product.name, Product.description, Product.price)
+            .where(Product.merchant_id == merchant.id, Product.status == ProductStatus.ONLINE)
+            .order_by(Product.created_at.desc(), Product.id.desc())
+        )
+        entries = [ProductEntry(*row) for row in result.all()]
+        # 大目录建索引较耗 CPU，放到线程池里，避免阻塞事件循环
+        index = await run_in_threadpool(ProductIndex, entries)
+        cache_product_index(merchant, index)
 
-    # Generate product context
-    product_context = await deepseek_service.generate_product_context(products)
+    # 只把与问题最相关的商品放进提示词
+    context = index.render(message, settings.CHAT_CONTEXT_TOP_K, settings.CHAT_CONTEXT_TOKEN_BUDGET)
+    return merchant, context
 
-    # Prepare messages for DeepSeek
-    messages = [{"role": "user", "content": chat_request.message}]
+def normalize_question(message: str) -> str:
+    """Fold width, case, whitespace and trailing punctuation so repeats of a question match"""
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.。？！~ ")
 
-    # Get response from DeepSeek
-    reply = await deepseek_service.chat(messages, product_context)
+def answer_cache_key(merchant: Merchant, memory: ChatMemory, message: str) -> Optional[tuple]:
+    # 只有新对话的回答与上下文无关，才能在用户之间共享
+    if not memory.is_empty:
+        return None
+    return (merchant.id, merchant.catalog_version, normalize_question(message))
 
-    # Save chat history
+async def save_chat_history(db: AsyncSession, user_id: int, merchant_id: int, message: str, reply: str) -> None:
     chat_history = ChatHistory(
-        user_id=current_user.id,
-        merchant_id=merchant.id,
+        user_id=user_id,
+        merchant_id=merchant_id,
         messages=[
-            {"role": "user", "content": chat_request.message},
+            {"role": "user", "content": message},
             {"role": "assistant", "content": reply}
         ]
     )
     db.add(chat_history)
-    db.commit()
+    await db.commit()
+
+async def _compact_memory(user_id: int, merchant_id: int) -> None:
+    # 摘要需要调用模型，放在响应之后执行，并使用独立的会话
+    async with AsyncSessionLocal() as db:
+        await compact_memory(db, user_id, merchant_id)
+
+@router.post("/", response_model=ChatResponse)
+async def chat_with_merchant(
+    chat_request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    merchant, product_context = await prepare_product_context(db, chat_request.merchant_id, chat_request.message)
+
+    # Prepare messages for DeepSeek: summary + recent turns + the new message
+    memory = await load_memory(db, current_user.id, chat_request.merchant_id)
+    messages = memory.messages() + [{"role": "user", "content": chat_request.message}]
+
+    # Get response from DeepSeek
+    cache_key = answer_cache_key(merchant, memory, chat_request.message)
+    reply = await deepseek_service.chat(messages, product_context, cache_key=cache_key)
+
+    # Save chat history
+    await save_chat_history(db, current_user.id, chat_request.merchant_id, chat_request.message, reply)
+    background_tasks.add_task(_compact_memory, current_user.id, chat_request.merchant_id)
 
     return ChatResponse(reply=reply)
+
+def sse_event(data: dict, event: str = None) -> str:
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+async def _save_streamed_history(user_id: int, merchant_id: int, message: str, reply: str) -> None:
+    # 请求的数据库会话在响应开始时已关闭，这里使用新的会话
+    async with AsyncSessionLocal() as db:
+        await save_chat_history(db, user_id, merchant_id, message, reply)
+        await compact_memory(db, user_id, merchant_id)
+
+@router.post("/stream")
+async def chat_with_merchant_stream(
+    chat_request: ChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream the assistant reply as Server-Sent Events.
+
+    Each ``message`` event carries ``{"delta": "..."}``; the stream ends with
+    a ``done`` event holding the full reply, or an ``error`` event. A reply
+    that ended with an error is neither cached nor saved to the chat history.
+    """
+    merchant, product_context = await prepare_product_context(db, chat_request.merchant_id, chat_request.message)
+    memory = await load_memory(db, current_user.id, chat_request.merchant_id)
+    messages = memory.messages() + [{"role": "user", "content": chat_request.message}]
+    cache_key = answer_cache_key(merchant, memory, chat_request.message)
+    cached_reply = deepseek_service.answer_cache.get(cache_key) if cache_key else None
+    user_id = current_user.id
+
+    async def events():
+        parts = []
+        try:
+            if cached_reply is not None:
+                parts.append(cached_reply)
+                yield sse_event({"delta": cached_reply})
+            else:
+                async for delta in deepseek_service.chat_stream(messages, product_context):
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+        except DeepSeekUnavailable:
+            yield sse_event({"error": UNAVAILABLE_MESSAGE}, event="error")
+            return
+        except httpx.HTTPStatusError as e:
+            yield sse_event({"error": f"Error communicating with DeepSeek API: {e.response.status_code}"}, event="error")
+            return
+        except httpx.HTTPError as e:
+            yield sse_event({"error": f"Error: {str(e)}"}, event="error")
+            return
+
+        reply = "".join(parts)
+        if cache_key and cached_reply is None and deepseek_service.api_key:
+            deepseek_service.answer_cache.set(cache_key, reply)
+        yield sse_event({"reply": reply}, event="done")
+
+        # 客户端收到 done 后可能立即断开，shield 保证聊天记录仍然写入
+        await asyncio.shield(_save_streamed_history(user_id, chat_request.merchant_id, chat_request.message, reply))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.delete("/session/{merchant_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_chat_session(
+    merchant_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Start a new conversation with the merchant; earlier turns are no longer sent to the model"""
+    await reset_memory(db, current_user.id, merchant_id)
@@ -1,181 +1,223 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+from collections import Counter
+from datetime import datetime
 from ..database import get_db
-from ..models import Order, OrderItem, User, Product, Merchant, Cart, OrderStatus
+from ..models import Order, OrderItem, User, Product, ProductStatus, Merchant, Cart, CartItem, OrderStatus
 from ..schemas import OrderCreate, OrderResponse, OrderStatusUpdate, OrderItemResponse
-from ..auth import get_current_user, get_current_merchant
+from ..auth import get_current_user, get_current_merchant, invalidate_principal
+from ..pagination import keyset_page, NEXT_CURSOR_HEADER
+from ..services import idempotency, inventory
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+def query_orders_with_items(db: Session):
+    """Order query that eagerly loads items and their products.
+
+    selectinload keeps the cost at three queries (orders, items, products)
+    regardless of how many orders are returned.
+    """
+    return db.query(Order).options(
+        selectinload(Order.items).selectinload(OrderItem.product)
+    )
+
+def build_order_item_response(item: OrderItem) -> OrderItemResponse:
+    product = item.product
+    return OrderItemResponse(
+        id=item.id,
+        product_id=item.product_id,
+        quantity=item.quantity,
+        price_at_purchase=item.price_at_purchase,
+        product_name=product.name if product else None,
+        product_image=product.image_paths[0] if product and product.image_paths else None
+    )
+
+def build_order_response(order: Order, items: Optional[List[OrderItem]] = None) -> OrderResponse:
+    """Serialize an order loaded via query_orders_with_items.
+
+    Pass ``items`` to restrict the response to a subset of the order lines.
+    """
+    if items is None:
+        items = order.items
+    return OrderResponse(
+        id=order.id,
+        user_id=order.user_id,
+        total_price=order.total_price,
+        status=order.status,
+        shipping_address=order.shipping_address,
+        contact_name=order.contact_name,
+        contact_phone=order.contact_phone,
+        created_at=order.created_at,
+        updated_at=order.updated_at,
+        items=[build_order_item_response(item) for item in items]
+    )
+
+def get_merchant_or_404(current_user: User, db: Session) -> Merchant:
+    merchant = db.query(Merchant).filter(Merchant.user_id == current_user.id).first()
+    if not merchant:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Merchant not found"
+        )
+    return merchant
+
+def merchant_items(order: Order, merchant: Merchant) -> List[OrderItem]:
+    """Order lines that belong to the given merchant"""
+    return [item for item in order.items if item.merchant_id == merchant.id]
+
 @router.post("/", response_model=OrderResponse)
 def create_order(
     order_data: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # 计算总价
-    total_price = sum(item.price_at_purchase * item.quantity for item in order_data.items)
+    # 客户端重试：直接返回第一次下单的结果
+    replay = idempotency.begin(db, current_user.id, idempotency_key, "POST /orders", order_data)
+    if replay is not None:
+        return replay
 
-    # 检查用户余额
-    if current_user.balance < total_price:
+    if not order_data.items or any(item.quantity <= 0 for item in order_data.items):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Insufficient balance. Required: {total_price}, Available: {current_user.balance}"
+            detail="Order must contain items with positive quantities"
         )
 
-    # 扣除余额
-    current_user.balance -= total_price
-
-    # 创建订单
-    new_order = Order(
-        user_id=current_user.id,
-        total_price=total_price,
-        status=OrderStatus.PENDING_PAYMENT,
-        shipping_address=order_data.shipping_address,
-        contact_name=order_data.contact_name,
-        contact_phone=order_data.contact_phone
-    )
-    db.add(new_order)
-    db.flush()  # 获取订单ID
-
-    # 创建订单项
-    for item_data in order_data.items:
-        order_item = OrderItem(
-            order_id=new_order.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity,
-            price_at_purchase=item_data.price_at_purchase
+    # 一次查询取出所有商品的当前价格和所属商家，按服务端价格计价
+    product_ids = {item.product_id for item in order_data.items}
+    products = {
+        row.id: row for row in db.execute(
+            select(Product.id, Product.merchant_id, Product.price, Product.status)
+            .where(Product.id.in_(product_ids))
+        )
+    }
+    if len(products) != len(product_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
         )
-        db.add(order_item)
+    for item in order_data.items:
+        product = products[item.product_id]
+        if product.status != ProductStatus.ONLINE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Product {product.id} is not available"
+            )
+        # 客户端展示的价格已过期时不按新价格扣款，让用户确认
+        if item.price_at_purchase is not None and item.price_at_purchase != product.price:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Price of product {product.id} has changed to {product.price}"
+            )
 
-    # 清空购物车
-    cart = db.query(Cart).filter(Cart.user_id == current_user.id).first()
-    if cart:
-        cart.items = []
+    total_price = sum(products[item.product_id].price * item.quantity for item in order_data.items)
 
-    db.commit()
-    db.refresh(new_order)
-
-    # 加载订单项并添加商品信息
-    order_items_with_product = []
-    for item in new_order.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        item_response = OrderItemResponse(
-            id=item.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            price_at_purchase=item.price_at_purchase,
-            product_name=product.name if product else None,
-            product_image=product.image_paths[0] if product and product.image_paths else None
+    # 预留库存，库存不足返回 409；商家超时未处理时由后台任务取消订单并归还
+    quantities = Counter()
+    for item in order_data.items:
+        quantities[item.product_id] += item.quantity
+    reserved = inventory.reserve(db, quantities)
+
+    # 条件扣款：余额检查和扣减在同一条语句中完成，并发下单不会丢失更新，
+    # 行锁只持有到本事务提交
+    balance = db.execute(
+        update(User)
+        .where(User.id == current_user.id, User.balance >= total_price)
+        .values(balance=User.balance - total_price)
+        .returning(User.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if balance is None:
+        available = db.execute(select(User.balance).where(User.id == current_user.id)).scalar_one()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient balance. Required: {total_price}, Available: {available}"
         )
-        order_items_with_product.append(item_response)
+    invalidate_principal(db, current_user.username)
 
-    return OrderResponse(
-        id=new_order.id,
-        user_id=new_order.user_id,
-        total_price=new_order.total_price,
-        status=new_order.status,
-        shipping_address=new_order.shipping_address,
-        contact_name=new_order.contact_name,
-        contact_phone=new_order.contact_phone,
-        created_at=new_order.created_at,
-        updated_at=new_order.updated_at,
-        items=order_items_with_product
+    # 创建订单
+    order_id = db.execute(
+        insert(Order).values(
+            user_id=current_user.id,
+            total_price=total_price,
+            status=OrderStatus.PENDING_PAYMENT,
+            shipping_address=order_data.shipping_address,
+            contact_name=order_data.contact_name,
+            contact_phone=order_data.contact_phone,
+            reserved_until=inventory.reservation_deadline() if reserved else None
+        ).returning(Order.id)
+    ).scalar_one()
+
+    # 一条语句插入所有订单项
+    db.execute(insert(OrderItem), [
+        {
+            "order_id": order_id,
+            "product_id": item.product_id,
+            "merchant_id": products[item.product_id].merchant_id,
+            "quantity": item.quantity,
+            "price_at_purchase": products[item.product_id].price,
+            "reserved_quantity": item.quantity if item.product_id in reserved else 0,
+        }
+        for item in order_data.items
+    ])
+
+    # 清空购物车
+    db.execute(
+        delete(CartItem)
+        .where(CartItem.cart_id.in_(select(Cart.id).where(Cart.user_id == current_user.id)))
+        .execution_options(synchronize_session=False)
     )
 
+    # 重新加载订单、订单项及商品信息；响应与订单一起提交，供重试回放
+    order = query_orders_with_items(db).filter(Order.id == order_id).one()
+    body = build_order_response(order).model_dump_json().encode("utf-8")
+    response = idempotency.complete(db, current_user.id, idempotency_key, body)
+    db.commit()
+    return response
+
 @router.get("/my-orders", response_model=List[OrderResponse])
 def get_my_orders(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    orders = db.query(Order).filter(Order.user_id == current_user.id).order_by(Order.created_at.desc()).all()
-
-    result = []
-    for order in orders:
-        order_items_with_product = []
-        for item in order.items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            item_response = OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price_at_purchase=item.price_at_purchase,
-                product_name=product.name if product else None,
-                product_image=product.image_paths[0] if product and product.image_paths else None
-            )
-            order_items_with_product.append(item_response)
-
-        result.append(OrderResponse(
-            id=order.id,
-            user_id=order.user_id,
-            total_price=order.total_price,
-            status=order.status,
-            shipping_address=order.shipping_address,
-            contact_name=order.contact_name,
-            contact_phone=order.contact_phone,
-            created_at=order.created_at,
-            updated_at=order.updated_at,
-            items=order_items_with_product
-        ))
-
-    return result
+    orders = query_orders_with_items(db).filter(
+        Order.user_id == current_user.id
+    ).order_by(Order.created_at.desc()).all()
+
+    return [build_order_response(order) for order in orders]
 
 @router.get("/merchant/orders", response_model=List[OrderResponse])
 def get_merchant_orders(
+    response: Response,
+    status_filter: Optional[OrderStatus] = Query(None, alias="status", description="Order status"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Next-page token from X-Next-Cursor"),
     current_user: User = Depends(get_current_merchant),
     db: Session = Depends(get_db)
 ):
     # 获取商家
-    merchant = db.query(Merchant).filter(Merchant.user_id == current_user.id).first()
-    if not merchant:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Merchant not found"
+    merchant = get_merchant_or_404(current_user, db)
+
+    # 包含该商家商品的订单号，沿 (merchant_id, order_id) 索引倒序读取，新订单在前
+    order_ids = db.query(OrderItem.order_id).filter(
+        OrderItem.merchant_id == merchant.id
+    ).distinct()
+    if status_filter is not None:
+        order_ids = order_ids.join(Order, Order.id == OrderItem.order_id).filter(
+            Order.status == status_filter
         )
+    rows, next_cursor = keyset_page(order_ids, [OrderItem.order_id], cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
-    # 获取包含该商家商品的所有订单
-    merchant_product_ids = [p.id for p in merchant.products]
-
-    order_items = db.query(OrderItem).filter(
-        OrderItem.product_id.in_(merchant_product_ids)
-    ).all()
-
-    order_ids = list(set([item.order_id for item in order_items]))
-    orders = db.query(Order).filter(Order.id.in_(order_ids)).order_by(Order.created_at.desc()).all()
-
-    result = []
-    for order in orders:
-        # 只包含该商家的商品
-        merchant_items = [item for item in order.items if item.product_id in merchant_product_ids]
-
-        order_items_with_product = []
-        for item in merchant_items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            item_response = OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price_at_purchase=item.price_at_purchase,
-                product_name=product.name if product else None,
-                product_image=product.image_paths[0] if product and product.image_paths else None
-            )
-            order_items_with_product.append(item_response)
-
-        result.append(OrderResponse(
-            id=order.id,
-            user_id=order.user_id,
-            total_price=order.total_price,
-            status=order.status,
-            shipping_address=order.shipping_address,
-            contact_name=order.contact_name,
-            contact_phone=order.contact_phone,
-            created_at=order.created_at,
-            updated_at=order.updated_at,
-            items=order_items_with_product
-        ))
-
-    return result
+    orders = query_orders_with_items(db).filter(
+        Order.id.in_([row.order_id for row in rows])
+    ).order_by(Order.id.desc()).all()
+
+    # 只包含该商家的商品
+    return [build_order_response(order, merchant_items(order, merchant)) for order in orders]
 
 @router.put("/{order_id}/status", response_model=OrderResponse)
 def update_order_status(
@@ -185,15 +227,10 @@ def update_order_status(
     db: Session = Depends(get_db)
 ):
     # 获取商家
-    merchant = db.query(Merchant).filter(Merchant.user_id == current_user.id).first()
-    if not merchant:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Merchant not found"
-        )
+    merchant = get_merchant_or_404(current_user, db)
 
     # 获取订单
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = query_orders_with_items(db).filter(Order.id == order_id).first()
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -201,43 +238,49 @@ def update_order_status(
         )
 
     # 验证订单包含该商家的商品
-    merchant_product_ids = [p.id for p in merchant.products]
-    has_merchant_product = any(item.product_id in merchant_product_ids for item in order.items)
-
-    if not has_merchant_product:
+    if not merchant_items(order, merchant):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this order"
         )
 
-    # 更新状态
-    order.status = status_update.status
-    db.commit()
-    db.refresh(order)
-
-    # 构建响应
-    order_items_with_product = []
-    for item in order.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        item_response = OrderItemResponse(
-            id=item.id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            price_at_purchase=item.price_at_purchase,
-            product_name=product.name if product else None,
-            product_image=product.image_paths[0] if product and product.image_paths else None
+    if status_update.status == OrderStatus.CANCELLED:
+        # 取消会退回整个订单的货款、归还所有商品的库存，只允许订单中
+        # 全部商品都属于该商家时取消
+        if len(merchant_items(order, merchant)) != len(order.items):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Order contains other merchants' items and cannot be cancelled"
+            )
+        # 取消订单：归还库存并退款；已取消的订单重复取消不做任何事
+        cancelled = inventory.cancel_orders(
+            db, [order.id], [OrderStatus.PENDING_PAYMENT, OrderStatus.PENDING_SHIPMENT]
         )
-        order_items_with_product.append(item_response)
+        if not cancelled and order.status != OrderStatus.CANCELLED:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Order can no longer be cancelled"
+            )
+    else:
+        # 条件更新：订单可能刚被超时任务取消，库存和货款都已退回。
+        # 商家处理后预留的库存即已售出，不再参与超时清理
+        values = {"status": status_update.status, "updated_at": datetime.utcnow()}
+        if status_update.status != OrderStatus.PENDING_PAYMENT:
+            values["reserved_until"] = None
+        updated = db.execute(
+            update(Order)
+            .where(Order.id == order.id, Order.status != OrderStatus.CANCELLED)
+            .values(**values)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if updated is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Order has been cancelled"
+            )
+    db.commit()
 
-    return OrderResponse(
-        id=order.id,
-        user_id=order.user_id,
-        total_price=order.total_price,
-        status=order.status,
-        shipping_address=order.shipping_address,
-        contact_name=order.contact_name,
-        contact_phone=order.contact_phone,
-        created_at=order.created_at,
-        updated_at=order.updated_at,
-        items=order_items_with_product
-    )
+    # 构建响应（提交后重新加载，避免逐个刷新过期的订单项）
+    order = query_orders_with_items(db).filter(Order.id == order_id).one()
+    return build_order_response(order)
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..database import get_db
 from ..models import Product, Merchant, User, ProductStatus
-from ..schemas import ProductCreate, ProductUpdate, ProductResponse
+from ..schemas import (
+    ProductCreate, ProductUpdate, ProductResponse, StockUpdate, StockResponse, product_json, products_json
+)
 from ..auth import get_current_user, get_current_merchant
+from ..pagination import keyset_page, NEXT_CURSOR_HEADER
+from ..services.catalog import bump_catalog_version
+from ..services.catalog_cache import (
+    product_cache, listing_cache, cached_json, conditional_response, invalidate_product
+)
+from ..services.image_store import release_images, purge_released, restore_released
+from ..services import inventory
 import os
 import uuid
 from ..config import settings
@@ -36,32 +45,49 @@ def create_product(
         status=ProductStatus.OFFLINE
     )
     db.add(new_product)
+    db.flush()
+    bump_catalog_version(db, merchant.id)
+    invalidate_product(db, new_product.id)
     db.commit()
     db.refresh(new_product)
     return new_product
 
 @router.get("/", response_model=List[ProductResponse])
 def get_products(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     status_filter: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Product)
-    if status_filter:
-        query = query.filter(Product.status == status_filter)
-    products = query.offset(skip).limit(limit).all()
-    return products
+    """List products, newest first.
+
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` to fetch the
+    next page; ``skip`` is kept for older clients.
+    """
+    def render():
+        query = db.query(Product)
+        if status_filter:
+            query = query.filter(Product.status == status_filter)
+        products, next_cursor = keyset_page(query, [Product.created_at, Product.id], cursor, limit, offset=skip)
+        return products_json(products), {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+    key = ("products", skip, limit, cursor, status_filter)
+    return conditional_response(request, cached_json(listing_cache, key, render))
 
 @router.get("/{product_id}", response_model=ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
-    return product
+def get_product(product_id: int, request: Request, db: Session = Depends(get_db)):
+    def render():
+        product = db.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        return product_json(product)
+
+    return conditional_response(request, cached_json(product_cache, product_id, render))
 
 @router.put("/{product_id}", response_model=ProductResponse)
 def update_product(
@@ -94,6 +120,8 @@ def update_product(
     for field, value in update_data.items():
         setattr(product, field, value)
 
+    bump_catalog_version(db, merchant.id)
+    invalidate_product(db, product.id)
     db.commit()
     db.refresh(product)
     return product
@@ -112,11 +140,11 @@ def delete_product(
             detail="Merchant profile not found"
         )
 
-    # Get product
+    # Get product; 锁住商品行，释放图片引用前不会再有并发上传追加 image_paths
     product = db.query(Product).filter(
         Product.id == product_id,
         Product.merchant_id == merchant.id
-    ).first()
+    ).with_for_update().first()
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -124,9 +152,62 @@ def delete_product(
         )
 
     db.delete(product)
-    db.commit()
+    bump_catalog_version(db, merchant.id)
+    invalidate_product(db, product.id)
+    stashed = release_images(db, product.image_paths or [])
+    try:
+        db.commit()
+    except Exception:
+        restore_released(stashed)
+        raise
+    purge_released(stashed)
     return {"message": "Product deleted successfully"}
 
+@router.get("/{product_id}/stock", response_model=StockResponse)
+def get_product_stock(product_id: int, db: Session = Depends(get_db)):
+    if db.query(Product.id).filter(Product.id == product_id).first() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    return StockResponse(product_id=product_id, available=inventory.get_stock(db, product_id))
+
+@router.put("/{product_id}/stock", response_model=StockResponse)
+def set_product_stock(
+    product_id: int,
+    stock_data: StockUpdate,
+    current_user: User = Depends(get_current_merchant),
+    db: Session = Depends(get_db)
+):
+    # Get merchant
+    merchant = db.query(Merchant).filter(Merchant.user_id == current_user.id).first()
+    if not merchant:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Merchant profile not found"
+        )
+
+    # Get product
+    product = db.query(Product.id).filter(
+        Product.id == product_id,
+        Product.merchant_id == merchant.id
+    ).first()
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found or unauthorized"
+        )
+
+    if stock_data.quantity < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Stock cannot be negative"
+        )
+
+    inventory.set_stock(db, product_id, stock_data.quantity)
+    db.commit()
+    return StockResponse(product_id=product_id, available=stock_data.quantity)
+
 @router.get("/merchant/my-products", response_model=List[ProductResponse])
 def get_my_products(
     current_user: User = Depends(get_current_merchant),
@@ -1,44 +1,61 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import func, cast, Double
 from typing import List, Optional
 from ..database import get_db
 from ..models import Product, ProductStatus
-from ..schemas import ProductResponse
+from ..schemas import ProductResponse, products_json
+from ..pagination import keyset_page, NEXT_CURSOR_HEADER
+from ..services.search_index import build_tsquery
+from ..services.catalog_cache import listing_cache, cached_json, conditional_response
 
 router = APIRouter(prefix="/search", tags=["search"])
 
 @router.get("/", response_model=List[ProductResponse])
 def search_products(
+    request: Request,
     q: Optional[str] = Query(None, description="Search keyword"),
     min_price: Optional[float] = Query(None, description="Minimum price"),
     max_price: Optional[float] = Query(None, description="Maximum price"),
     category_id: Optional[int] = Query(None, description="Category ID"),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Next-page token from X-Next-Cursor"),
     db: Session = Depends(get_db)
 ):
-    # Start with online products only
-    query = db.query(Product).filter(Product.status == ProductStatus.ONLINE)
-
-    # Apply keyword search
-    if q:
-        query = query.filter(
-            or_(
-                Product.name.ilike(f"%{q}%"),
-                Product.description.ilike(f"%{q}%")
+    def render():
+        # Apply keyword search through the full-text index, ranked by relevance
+        tsquery = build_tsquery(q)
+        if tsquery is not None:
+            # ts_rank 返回 real；转成 double 才能与游标中的值精确比较
+            rank = cast(func.ts_rank(Product.search_vector, tsquery), Double)
+            query = db.query(Product, rank.label("rank")).filter(
+                Product.search_vector.op("@@")(tsquery)
             )
-        )
+            order_columns = [rank, Product.id]
+            row_key = lambda row: (row.rank, row.Product.id)
+        else:
+            query = db.query(Product)
+            order_columns = [Product.created_at, Product.id]
+            row_key = None
+
+        # Online products only
+        query = query.filter(Product.status == ProductStatus.ONLINE)
+
+        # Apply price filters
+        if min_price is not None:
+            query = query.filter(Product.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.price <= max_price)
 
-    # Apply price filters
-    if min_price is not None:
-        query = query.filter(Product.price >= min_price)
-    if max_price is not None:
-        query = query.filter(Product.price <= max_price)
+        # Apply category filter
+        if category_id is not None:
+            query = query.filter(Product.category_id == category_id)
 
-    # Apply category filter
-    if category_id is not None:
-        query = query.filter(Product.category_id == category_id)
+        rows, next_cursor = keyset_page(query, order_columns, cursor, limit, key=row_key, offset=skip)
+        if tsquery is not None:
+            rows = [row.Product for row in rows]
+        return products_json(rows), {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
 
-    products = query.offset(skip).limit(limit).all()
-    return products
+    key = ("search", (q or "").strip(), min_price, max_price, category_id, skip, limit, cursor)
+    return conditional_response(request, cached_json(listing_cache, key, render))
@@ -1,17 +1,27 @@
+import asyncio
+import hashlib
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Tuple
+from ..database import get_db, get_async_db
 from ..models import Product, Merchant, User
 from ..auth import get_current_merchant
 import os
-import uuid
 from ..config import settings
+from ..services.catalog import bump_catalog_version, bump_catalog_version_async
+from ..services.catalog_cache import invalidate_product, invalidate_product_async
+from ..services.image_store import (
+    acquire_image_async, place_object, temp_upload_path,
+    release_images, purge_released, restore_released,
+)
+from ..services.image_variants import ALLOWED_EXTENSIONS, schedule_variants
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
-ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
-
 def validate_image(file: UploadFile):
     # Check file extension
     ext = os.path.splitext(file.filename)[1].lower()
@@ -21,15 +31,110 @@ def validate_image(file: UploadFile):
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
 
+# multipart 边界和字段头的余量
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class UploadSizeLimitMiddleware:
+    """Reject uploads over the request limit before the body is spooled.
+
+    The multipart body is parsed before the route runs, so this is the only
+    place an oversized upload can be refused before it is received. A
+    declared Content-Length over the limit is refused up front; bodies
+    without one (chunked transfer encoding) are counted as they arrive.
+    """
+
+    def __init__(self, app, path_prefix: str = "/api/upload"):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_bytes = settings.UPLOAD_MAX_REQUEST_BYTES + FORM_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.path_prefix):
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_bytes:
+                response = JSONResponse(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    content={"detail": "Upload too large"},
+                )
+                await response(scope, receive, send)
+                return
+
+            received = 0
+
+            async def limited_receive():
+                nonlocal received
+                message = await receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > self.max_bytes:
+                        # 表单解析中途抛出，由异常处理返回 413，不再继续接收
+                        raise _too_large("Upload too large")
+                return message
+
+            await self.app(scope, limited_receive, send)
+            return
+        await self.app(scope, receive, send)
+
+class _RequestBudget:
+    """Bytes left for all files of one request; shared by the concurrent writers"""
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+
+    def consume(self, size: int) -> None:
+        self.remaining -= size
+        if self.remaining < 0:
+            raise _too_large(f"Total upload size exceeds {settings.UPLOAD_MAX_REQUEST_BYTES} bytes")
+
+def _write_chunk(f, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+async def save_upload(file: UploadFile, path: str, budget: _RequestBudget) -> Tuple[str, int]:
+    """Copy the upload to ``path`` chunk by chunk, enforcing the size limits as it goes.
+
+    Returns the SHA-256 hex digest and size of the content. File IO and
+    hashing run in the thread pool; a partially written file is removed on failure.
+    """
+    written = 0
+    digest = hashlib.sha256()
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > settings.UPLOAD_MAX_FILE_BYTES:
+                raise _too_large(f"{file.filename} exceeds {settings.UPLOAD_MAX_FILE_BYTES} bytes")
+            budget.consume(len(chunk))
+            await run_in_threadpool(_write_chunk, f, digest, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(_remove_file, path)
+        raise
+    await run_in_threadpool(f.close)
+    return digest.hexdigest(), written
+
 @router.post("/product/{product_id}/images")
 async def upload_product_images(
     product_id: int,
     files: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_merchant),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Get merchant
-    merchant = db.query(Merchant).filter(Merchant.user_id == current_user.id).first()
+    result = await db.execute(select(Merchant).where(Merchant.user_id == current_user.id))
+    merchant = result.scalar_one_or_none()
     if not merchant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -37,44 +142,78 @@ async def upload_product_images(
         )
 
     # Get product
-    product = db.query(Product).filter(
+    result = await db.execute(select(Product).where(
         Product.id == product_id,
         Product.merchant_id == merchant.id
-    ).first()
+    ))
+    product = result.scalar_one_or_none()
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found or unauthorized"
         )
 
-    # Ensure upload directory exists
-    upload_dir = os.path.join(settings.UPLOAD_DIR, "products", str(product_id))
-    os.makedirs(upload_dir, exist_ok=True)
-
-    uploaded_paths = []
     for file in files:
         validate_image(file)
 
-        # Generate unique filename
-        ext = os.path.splitext(file.filename)[1]
-        filename = f"{uuid.uuid4()}{ext}"
-        file_path = os.path.join(upload_dir, filename)
+    # 先接收到临时文件，按内容哈希确定最终路径
+    temp_paths = [temp_upload_path() for _ in files]
+    await run_in_threadpool(os.makedirs, os.path.dirname(temp_paths[0]), exist_ok=True)
 
-        # Save file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+    # Save files concurrently
+    budget = _RequestBudget(settings.UPLOAD_MAX_REQUEST_BYTES)
+    results = await asyncio.gather(
+        *(save_upload(file, path, budget) for file, path in zip(files, temp_paths)),
+        return_exceptions=True,
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # 任一文件失败则整批作废，删除已写入的文件
+        for path in temp_paths:
+            await run_in_threadpool(_remove_file, path)
+        raise next((e for e in errors if isinstance(e, HTTPException)), errors[0])
 
-        # Store relative path
-        relative_path = f"products/{product_id}/{filename}"
-        uploaded_paths.append(relative_path)
+    # 相同内容只保存一份：引用计数加一，再把文件移到内容地址
+    uploaded_paths = [None] * len(files)
+    new_objects = []
+    try:
+        # 接收文件期间不持有锁；修改 image_paths 和引用计数前锁住商品行，
+        # 并发的上传和删除依次读改写，不会丢失图片或留下错误的引用计数
+        result = await db.execute(
+            select(Product)
+            .where(Product.id == product.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        product = result.scalar_one_or_none()
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found or unauthorized"
+            )
+        # 按哈希排序加锁，避免并发上传互相死锁
+        for i in sorted(range(len(files)), key=lambda i: results[i][0]):
+            digest, size = results[i]
+            ext = os.path.splitext(files[i].filename)[1]
+            path, is_new = await acquire_image_async(db, digest, ext, size)
+            await run_in_threadpool(place_object, temp_paths[i], path)
+            uploaded_paths[i] = path
+            if is_new:
+                new_objects.append(os.path.join(settings.UPLOAD_DIR, path))
+    finally:
+        for path in temp_paths:
+            await run_in_threadpool(_remove_file, path)
 
     # Update product image paths
     if product.image_paths is None:
         product.image_paths = []
     product.image_paths = product.image_paths + uploaded_paths
-    db.commit()
-    db.refresh(product)
+    await bump_catalog_version_async(db, merchant.id)
+    await invalidate_product_async(db, product.id)
+    await db.commit()
+
+    # 缩略图在后台进程中生成，已存在的内容不再重复生成
+    schedule_variants(new_objects)
 
     return {
         "message": "Images uploaded successfully",
@@ -97,11 +236,11 @@ def delete_product_image(
             detail="Merchant profile not found"
         )
 
-    # Get product
+    # Get product; 锁住商品行，与并发的上传、删除依次修改 image_paths 和引用计数
     product = db.query(Product).filter(
         Product.id == product_id,
         Product.merchant_id == merchant.id
-    ).first()
+    ).with_for_update().first()
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -110,13 +249,19 @@ def delete_product_image(
 
     # Remove from database
     if product.image_paths and image_path in product.image_paths:
-        product.image_paths.remove(image_path)
-        db.commit()
+        removed = [path for path in product.image_paths if path == image_path]
+        product.image_paths = [path for path in product.image_paths if path != image_path]
+        bump_catalog_version(db, merchant.id)
+        invalidate_product(db, product.id)
 
-        # Delete physical file
-        full_path = os.path.join(settings.UPLOAD_DIR, image_path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
+        # 不再被引用的图片文件在提交后删除
+        stashed = release_images(db, removed)
+        try:
+            db.commit()
+        except Exception:
+            restore_released(stashed)
+            raise
+        purge_released(stashed)
 
         return {"message": "Image deleted successfully"}
     else:
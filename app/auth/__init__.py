@@ -5,6 +5,8 @@ from .security import (
     get_current_user,
     get_current_merchant,
 )
+from .principal_cache import invalidate_principal, invalidate_principal_async
+from .hashing import password_hasher
 
 __all__ = [
     "verify_password",
@@ -12,4 +14,7 @@ __all__ = [
     "create_access_token",
     "get_current_user",
     "get_current_merchant",
+    "invalidate_principal",
+    "invalidate_principal_async",
+    "password_hasher",
 ]
@@ -0,0 +1,65 @@
+"""
+密码哈希专用线程池
+
+bcrypt 计算量大，如果直接在同步路由中执行，会占满 FastAPI 处理所有
+同步路由的公共线程池。这里用一个独立的、有界的线程池执行哈希，
+排队数超过上限时直接返回 503，而不是让整个服务卡住。
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from fastapi import HTTPException, status
+from ..config import settings
+
+class PasswordHasher:
+    def __init__(self, rounds: int, workers: int, max_pending: int):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # 正在执行 + 排队的任务总数上限
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def hash_sync(self, password: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    @staticmethod
+    def verify_sync(password: str, hashed_password: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.hash_sync, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.verify_sync, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True when the hash was made with a different cost factor than configured"""
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.BCRYPT_WORKERS,
+    max_pending=settings.BCRYPT_MAX_PENDING,
+)
@@ -0,0 +1,80 @@
+"""
+已认证用户（principal）缓存
+
+get_current_user 每次请求都要按用户名查询 users 表。这里按 token 的
+subject（用户名）缓存用户行的快照，命中时用 Session.merge(load=False)
+把快照挂到当前请求的 Session 上，无需任何查询。
+
+修改用户角色、余额或密码的代码必须调用 invalidate_principal，
+失效消息随事务提交后广播到所有 worker 进程（见 app/cache.py）。
+
+查询用户行和写入缓存之间可能有失效消息到达（查询读到的是提交前的旧值），
+因此查询前先记下该用户名的代数，代数变了就不写入缓存。
+"""
+import threading
+from typing import Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from ..cache import TTLCache, invalidation_bus
+from ..config import settings
+from ..models import User
+
+NAMESPACE = "principal"
+
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+# 失效代数：按用户名散列到固定数量的槽位，整体清空时另加全局代数
+GENERATION_SLOTS = 1024
+_generations = [0] * GENERATION_SLOTS
+_global_generation = 0
+_generation_lock = threading.Lock()
+
+def _slot(username: str) -> int:
+    return hash(username) % GENERATION_SLOTS
+
+def _on_invalidate(username: Optional[str]) -> None:
+    global _global_generation
+    with _generation_lock:
+        if username is None:
+            _global_generation += 1
+        else:
+            _generations[_slot(username)] += 1
+    if username is None:
+        principal_cache.clear()
+    else:
+        principal_cache.pop(username)
+
+invalidation_bus.subscribe(NAMESPACE, _on_invalidate)
+
+def _snapshot(user: User) -> User:
+    """Detached copy of the user's column values, safe to share between requests"""
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+def get_cached_principal(db: Session, username: str) -> Optional[User]:
+    snapshot = principal_cache.get(username)
+    if snapshot is None:
+        return None
+    return db.merge(snapshot, load=False)
+
+def principal_generation(username: str) -> Tuple[int, int]:
+    """Take before loading the user; pass to ``cache_principal`` afterwards"""
+    return _global_generation, _generations[_slot(username)]
+
+def cache_principal(user: User, generation: Tuple[int, int]) -> None:
+    """Cache the user unless it was invalidated since ``generation`` was taken"""
+    snapshot = _snapshot(user)
+    with _generation_lock:
+        if principal_generation(user.username) == generation:
+            principal_cache.set(user.username, snapshot)
+
+def invalidate_principal(db: Session, username: str) -> None:
+    """Drop the cached principal in every worker once ``db`` commits"""
+    invalidation_bus.publish(db, NAMESPACE, username)
+
+async def invalidate_principal_async(db: AsyncSession, username: str) -> None:
+    await invalidation_bus.publish_async(db, NAMESPACE, username)
@@ -1,7 +1,6 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
@@ -9,21 +8,22 @@ from ..config import settings
 from ..database import get_db
 from ..models import User
 from ..schemas import TokenData
+from .principal_cache import get_cached_principal, cache_principal, principal_generation
+from .hashing import password_hasher
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against a hashed password"""
-    password_bytes = plain_password.encode('utf-8')
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+    """Verify a plain password against a hashed password.
+
+    Runs on the calling thread; request handlers should await
+    password_hasher.verify instead.
+    """
+    return password_hasher.verify_sync(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """Hash a password using bcrypt"""
-    password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
+    """Hash a password using bcrypt with the configured cost factor"""
+    return password_hasher.hash_sync(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -50,9 +50,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
+    user = get_cached_principal(db, token_data.username)
+    if user is not None:
+        return user
+
+    # 查询期间到达的失效消息说明读到的可能是旧值，不写入缓存
+    generation = principal_generation(token_data.username)
     user = db.query(User).filter(User.username == token_data.username).first()
     if user is None:
         raise credentials_exception
+    cache_principal(user, generation)
     return user
 
 def get_current_merchant(current_user: User = Depends(get_current_user)) -> User:
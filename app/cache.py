@@ -0,0 +1,219 @@
+"""
+进程内缓存与跨进程失效通知
+
+TTLCache 是线程安全的 LRU + TTL 缓存。每个 worker 进程各自持有一份，
+因此写操作需要通过 InvalidationBus 通知所有进程：失效消息用 PostgreSQL
+的 NOTIFY 发送，随写事务一起提交后才投递，各进程的监听线程收到后清除
+对应条目。监听断开期间可能漏掉消息，重连后会清空所有订阅的缓存。
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= now:
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class CoalescingCache:
+    """TTLCache for async results that also coalesces concurrent misses.
+
+    While a value is being computed, callers asking for the same key await
+    the same task instead of starting another one. Failures are not cached:
+    the exception reaches every waiter and the next call tries again.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def get_or_call(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: 某个等待者断开时不取消其他人共享的调用
+        return await asyncio.shield(task)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self._cache.get(key, default)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._cache.set(key, value)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._cache.set(key, task.result())
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["coalesced"] = self.coalesced
+        stats["coalesced_rate"] = round(self.coalesced / lookups, 4) if lookups else 0.0
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+class InvalidationBus:
+    """Cross-process cache invalidation over PostgreSQL LISTEN/NOTIFY.
+
+    Handlers are registered per namespace and called with the invalidated
+    key, or with None when the whole namespace must be dropped.
+    """
+
+    CHANNEL = "cache_invalidation"
+    RECONNECT_DELAY = 5.0
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def subscribe(self, namespace: str, handler: Callable[[Optional[str]], None]) -> None:
+        self._handlers.setdefault(namespace, []).append(handler)
+
+    def _notify(self, namespace: str, key: Any):
+        key = str(key)
+        self._dispatch(namespace, key)
+        return (
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": self.CHANNEL, "payload": json.dumps([namespace, key])},
+        )
+
+    def publish(self, db: Session, namespace: str, key: Any) -> None:
+        """Invalidate ``key`` here now, and in every process once ``db`` commits"""
+        db.execute(*self._notify(namespace, key))
+
+    async def publish_async(self, db: AsyncSession, namespace: str, key: Any) -> None:
+        await db.execute(*self._notify(namespace, key))
+
+    def _dispatch(self, namespace: str, key: Optional[str]) -> None:
+        for handler in self._handlers.get(namespace, []):
+            handler(key)
+
+    def _dispatch_all(self) -> None:
+        for namespace in self._handlers:
+            self._dispatch(namespace, None)
+
+    def start(self, engine) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._listen, args=(engine,), name="cache-invalidation", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.RECONNECT_DELAY + 1)
+            self._thread = None
+
+    def _listen(self, engine) -> None:
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                # 专用连接，不归还连接池
+                connection = engine.raw_connection()
+                pg_connection = connection.driver_connection
+                connection.detach()
+                pg_connection.autocommit = True
+                with pg_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.CHANNEL}")
+                # 断开期间的消息已丢失，重新连上后全部清空
+                self._dispatch_all()
+                while not self._stopping.is_set():
+                    if select.select([pg_connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    pg_connection.poll()
+                    while pg_connection.notifies:
+                        notify = pg_connection.notifies.pop(0)
+                        try:
+                            namespace, key = json.loads(notify.payload)
+                        except (ValueError, TypeError):
+                            continue
+                        self._dispatch(namespace, key)
+            except Exception:
+                logger.exception("Cache invalidation listener failed, reconnecting")
+                self._dispatch_all()
+                self._stopping.wait(self.RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+invalidation_bus = InvalidationBus()
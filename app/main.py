@@ -1,10 +1,28 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import asyncio
+import logging
+import secrets
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Response, status
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
+from .database import engine, async_engine, Base, pool_metrics
+from .cache import invalidation_bus
+from .auth import password_hasher
+from .auth.principal_cache import principal_cache
+from .services.deepseek_service import deepseek_service
+from .services.catalog import product_index_cache
+from .services import catalog_cache
+from .services import image_variants
+from .services import idempotency
+from .services import inventory
+from .static_files import UploadStaticFiles
 from .api import auth, products, upload, search, chat, cart, orders, merchants
 from .config import settings
+from .pagination import NEXT_CURSOR_HEADER
 import os
+import time
+
+logger = logging.getLogger(__name__)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -15,6 +33,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Refuse oversized uploads before the body is received
+app.add_middleware(upload.UploadSizeLimitMiddleware)
+
 # CORS middleware for mobile app
 app.add_middleware(
     CORSMiddleware,
@@ -22,13 +43,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, idempotency.REPLAYED_HEADER],
 )
 
 # Create upload directory if it doesn't exist
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
 # Mount static files for uploaded images
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+app.mount("/uploads", UploadStaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+
+@app.on_event("startup")
+def start_cache_invalidation():
+    invalidation_bus.start(engine)
+
+@app.on_event("shutdown")
+def stop_cache_invalidation():
+    invalidation_bus.stop()
+
+_background_tasks = []
+
+@app.on_event("startup")
+async def start_idempotency_purge():
+    _background_tasks.append(asyncio.create_task(idempotency.purge_periodically()))
+
+@app.on_event("startup")
+async def start_reservation_sweeper():
+    _background_tasks.append(asyncio.create_task(inventory.sweep_periodically()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+def stop_image_workers():
+    image_variants.shutdown()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+
+@app.on_event("shutdown")
+async def close_deepseek_client():
+    await deepseek_service.aclose()
 
 # Include routers
 app.include_router(auth.router, prefix="/api")
@@ -49,5 +111,47 @@ def root():
     }
 
 @app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+def health_check(response: Response):
+    """Readiness check: database round trip and connection pool saturation"""
+    pools = pool_metrics()
+    database = {"pool": pools}
+    healthy = True
+
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        database["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    except Exception:
+        # 驱动的错误信息里有主机、端口和用户名，只写日志
+        logger.exception("Health check could not reach the database")
+        database["error"] = "unavailable"
+        healthy = False
+
+    if any(pool["saturation"] >= settings.HEALTH_POOL_SATURATION_LIMIT for pool in pools.values()):
+        database["saturated"] = True
+        healthy = False
+
+    if not healthy:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "healthy" if healthy else "unhealthy", "database": database}
+
+@app.get("/metrics")
+def metrics(authorization: Optional[str] = Header(None)):
+    """Internal counters, for monitoring that presents METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "db_pool": pool_metrics(),
+        "deepseek": deepseek_service.stats(),
+        "product_index_cache": product_index_cache.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+    }
@@ -3,8 +3,12 @@ from .merchant import Merchant
 from .category import Category
 from .product import Product, ProductStatus
 from .chat_history import ChatHistory
+from .chat_session import ChatSession
 from .cart import Cart, CartItem
 from .order import Order, OrderItem, OrderStatus
+from .image_blob import ImageBlob
+from .idempotency_key import IdempotencyKey
+from .inventory_shard import InventoryShard
 
 __all__ = [
     "User",
@@ -14,9 +18,13 @@ __all__ = [
     "Product",
     "ProductStatus",
     "ChatHistory",
+    "ChatSession",
     "Cart",
     "CartItem",
     "Order",
     "OrderItem",
     "OrderStatus",
+    "ImageBlob",
+    "IdempotencyKey",
+    "InventoryShard",
 ]
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..database import Base
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # 按会话读取最近几轮对话
+        Index("ix_chat_history_user_merchant_created", "user_id", "merchant_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Text, UniqueConstraint
+from datetime import datetime
+from ..database import Base
+
+class ChatSession(Base):
+    """Long-term memory of a user's conversation with one merchant's assistant"""
+    __tablename__ = "chat_sessions"
+    __table_args__ = (
+        UniqueConstraint("user_id", "merchant_id", name="uq_chat_sessions_user_merchant"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=False)
+    summary = Column(Text, nullable=False, default="")  # 较早对话的摘要
+    summarized_until = Column(Integer, nullable=False, default=0)  # 已并入摘要的最后一条 chat_history.id
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
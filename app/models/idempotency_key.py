@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, ForeignKey, Index
+from datetime import datetime
+from ..database import Base
+
+class IdempotencyKey(Base):
+    """Stored response of a write request, replayed when the client retries with the same key"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        # 定期清理过期的键
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)  # 客户端的 Idempotency-Key 请求头
+    endpoint = Column(String, nullable=False)  # 如 "POST /orders"，同一个键不能用于不同接口
+    request_hash = Column(String(64), nullable=False)  # 请求体的 SHA-256
+    status_code = Column(Integer, nullable=True)  # 处理完成前为空
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger
+from datetime import datetime
+from ..database import Base
+
+class ImageBlob(Base):
+    """An uploaded image stored once by content hash, shared by every product that uses it"""
+    __tablename__ = "image_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)  # 相对 UPLOAD_DIR，如 objects/ab/<sha256>.jpg
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # 引用它的 products.image_paths 条目数
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, ForeignKey, CheckConstraint
+from ..database import Base
+
+class InventoryShard(Base):
+    """One slice of a product's available stock; the shards of a product add up to its stock"""
+    __tablename__ = "inventory_shards"
+    __table_args__ = (
+        CheckConstraint("quantity >= 0", name="ck_inventory_shards_quantity"),
+    )
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)  # 0 .. INVENTORY_SHARDS-1
+    quantity = Column(Integer, nullable=False, default=0)
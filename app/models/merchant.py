@@ -9,6 +9,8 @@ class Merchant(Base):
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
     shop_name = Column(String, nullable=False)
     description = Column(Text)
+    # 商品目录版本，商品有任何变化时加一（见 services/catalog.py）
+    catalog_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="merchant")
     products = relationship("Product", back_populates="merchant")
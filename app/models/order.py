@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -13,6 +13,12 @@ class OrderStatus(str, enum.Enum):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # 我的订单，按下单时间倒序
+        Index("ix_orders_user_created", "user_id", "created_at"),
+        # 预留库存超时的待付款订单的清理
+        Index("ix_orders_status_reserved_until", "status", "reserved_until"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -21,6 +27,8 @@ class Order(Base):
     shipping_address = Column(String, nullable=True)
     contact_name = Column(String, nullable=True)
     contact_phone = Column(String, nullable=True)
+    # 下单时预留了库存的订单，保留到这个时间；没有预留库存的订单为空
+    reserved_until = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -30,12 +38,21 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+        Index("ix_order_items_product_id", "product_id"),
+        # 商家订单列表：按订单号倒序分页
+        Index("ix_order_items_merchant_order", "merchant_id", "order_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    # 下单时商品所属的商家
+    merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
     price_at_purchase = Column(Float, nullable=False)  # 购买时的价格
+    reserved_quantity = Column(Integer, nullable=False, default=0, server_default="0")  # 下单时从库存预留的数量
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
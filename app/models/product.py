@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, Text, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, Text, ARRAY, Index
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import enum
 from ..database import Base
+from ..services.search_index import search_vector_expression
 
 class ProductStatus(str, enum.Enum):
     ONLINE = "online"
@@ -10,6 +13,16 @@ class ProductStatus(str, enum.Enum):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # 游标分页排序键
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_status_created_at_id", "status", "created_at", "id"),
+        # 按分类、价格筛选在售商品
+        Index("ix_products_status_category_price", "status", "category_id", "price"),
+        Index("ix_products_merchant_id", "merchant_id"),
+        # 全文检索
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     merchant_id = Column(Integer, ForeignKey("merchants.id"), nullable=False)
@@ -19,7 +32,19 @@ class Product(Base):
     price = Column(Float, nullable=False)
     image_paths = Column(ARRAY(String))
     status = Column(Enum(ProductStatus), default=ProductStatus.OFFLINE, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # 由 name/description 自动生成，见 services/search_index.py
+    search_vector = deferred(Column(TSVECTOR))
 
     merchant = relationship("Merchant", back_populates="products")
     category = relationship("Category", back_populates="products")
+
+@event.listens_for(Product, "before_insert")
+def _index_new_product(mapper, connection, target):
+    target.search_vector = search_vector_expression(target.name, target.description)
+
+@event.listens_for(Product, "before_update")
+def _reindex_product(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.name.history.has_changes() or state.attrs.description.history.has_changes():
+        target.search_vector = search_vector_expression(target.name, target.description)
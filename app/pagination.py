@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+def _decode_value(value: Any):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row into an opaque page token"""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _check_value(value: Any, column) -> Any:
+    """Reject cursor values that do not match the column's Python type"""
+    try:
+        expected = column.type.python_type
+    except NotImplementedError:
+        return value
+    # bool 是 int 的子类，JSON 里的 true/false 不能当作 id
+    if isinstance(value, bool) and expected is not bool:
+        raise ValueError("cursor value has wrong type")
+    if expected is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, expected):
+        raise ValueError("cursor value has wrong type")
+    return value
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor has wrong shape")
+        return [_check_value(_decode_value(v), column) for v, column in zip(values, columns)]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_page(
+    query,
+    columns: Sequence,
+    cursor: Optional[str],
+    limit: int,
+    key: Optional[Callable[[Any], Sequence[Any]]] = None,
+    offset: int = 0,
+) -> Tuple[list, Optional[str]]:
+    """Fetch one page of ``query`` ordered by ``columns`` descending.
+
+    Rows after the cursor are selected with a row-value comparison, so the
+    database seeks straight to the page through an index on ``columns``
+    instead of counting past an offset. Returns the rows and the token for
+    the next page (None on the last page).
+
+    ``key`` extracts the sort values from a row; by default they are read
+    from the attributes named after ``columns``. ``offset`` is only honoured
+    without a cursor, for clients that still page with ``skip``.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.filter(tuple_(*columns) < tuple_(*values))
+
+    query = query.order_by(*[column.desc() for column in columns])
+    if offset and not cursor:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    if key is None:
+        values = [getattr(last, column.key) for column in columns]
+    else:
+        values = key(last)
+    return rows, encode_cursor(values)
@@ -1,9 +1,11 @@
 from .user import UserCreate, UserLogin, UserResponse, Token, TokenData
 from .merchant import MerchantCreate, MerchantUpdate, MerchantResponse
-from .product import ProductCreate, ProductUpdate, ProductResponse
+from .product import (
+    ProductCreate, ProductUpdate, ProductResponse, StockUpdate, StockResponse, product_json, products_json
+)
 from .category import CategoryCreate, CategoryResponse
 from .chat import ChatMessage, ChatRequest, ChatResponse
-from .cart import CartItemCreate, CartItemUpdate, CartItemResponse, CartResponse
+from .cart import CartItemCreate, CartItemUpdate, CartItemResponse, CartResponse, CartBatchLine, CartBatch
 from .order import OrderCreate, OrderResponse, OrderStatusUpdate, OrderItemResponse
 
 __all__ = [
@@ -18,6 +20,10 @@ __all__ = [
     "ProductCreate",
     "ProductUpdate",
     "ProductResponse",
+    "StockUpdate",
+    "StockResponse",
+    "product_json",
+    "products_json",
     "CategoryCreate",
     "CategoryResponse",
     "ChatMessage",
@@ -27,6 +33,8 @@ __all__ = [
     "CartItemUpdate",
     "CartItemResponse",
     "CartResponse",
+    "CartBatchLine",
+    "CartBatch",
     "OrderCreate",
     "OrderResponse",
     "OrderStatusUpdate",
@@ -10,6 +10,15 @@ class CartItemCreate(BaseModel):
 class CartItemUpdate(BaseModel):
     quantity: int
 
+class CartBatchLine(BaseModel):
+    product_id: int
+    quantity: int
+
+class CartBatch(BaseModel):
+    add: List[CartBatchLine] = []  # 数量累加到已有的行上
+    update: List[CartBatchLine] = []  # 数量设为给定值，0 表示删除
+    remove: List[int] = []  # 要删除的商品 id
+
 class CartItemResponse(BaseModel):
     id: int
     cart_id: int
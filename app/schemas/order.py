@@ -6,7 +6,8 @@ from ..models.order import OrderStatus
 class OrderItemCreate(BaseModel):
     product_id: int
     quantity: int
-    price_at_purchase: float
+    # 客户端展示的单价；订单按服务端当前价格计价，两者不一致时返回 409
+    price_at_purchase: Optional[float] = None
 
 class OrderCreate(BaseModel):
     items: List[OrderItemCreate]
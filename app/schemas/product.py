@@ -1,8 +1,10 @@
-from pydantic import BaseModel, field_validator
+import orjson
+from pydantic import BaseModel, computed_field, field_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from ..models.product import ProductStatus
 from ..config import settings
+from ..services.image_variants import variant_paths
 
 class ProductBase(BaseModel):
     name: str
@@ -20,6 +22,27 @@ class ProductUpdate(BaseModel):
     category_id: Optional[int] = None
     status: Optional[ProductStatus] = None
 
+class StockUpdate(BaseModel):
+    quantity: int  # 可售库存
+
+class StockResponse(BaseModel):
+    product_id: int
+    available: Optional[int] = None  # 为空表示不限库存
+
+# 图片URL前缀在启动时算好，序列化时不再逐条拼接 settings.BASE_URL
+_UPLOADS_PREFIX = f"{settings.BASE_URL}/uploads/"
+
+def _image_urls(paths) -> List[str]:
+    if not paths:
+        return []
+    return [path if path.startswith("http") else _UPLOADS_PREFIX + path for path in paths]
+
+def _image_variants(urls: List[str]) -> List[Dict[str, str]]:
+    return [
+        {**variant_paths(url), "original": url} if url.startswith(_UPLOADS_PREFIX) else {"original": url}
+        for url in urls
+    ]
+
 class ProductResponse(ProductBase):
     id: int
     merchant_id: int
@@ -31,9 +54,39 @@ class ProductResponse(ProductBase):
     @classmethod
     def convert_image_paths(cls, v):
         """将相对路径转换为完整URL"""
-        if v is None:
-            return []
-        return [f"{settings.BASE_URL}/uploads/{path}" if not path.startswith('http') else path for path in v]
+        return _image_urls(v)
+
+    @computed_field
+    @property
+    def image_variants(self) -> List[Dict[str, str]]:
+        """每张图片的各尺寸URL（thumb/medium/large 为 WebP），列表页应使用 thumb"""
+        return _image_variants(self.image_paths or [])
 
     class Config:
         from_attributes = True
+
+# 列表接口的快速序列化：直接读取 ORM 属性拼成 dict，由 orjson 编码，
+# 不再逐条经过 Pydantic 校验。输出必须与 ProductResponse 完全一致，
+# 修改 ProductResponse 的字段时要同步修改 product_dict。
+def product_dict(product) -> dict:
+    """ProductResponse fields of a Product ORM object, ready for orjson"""
+    urls = _image_urls(product.image_paths)
+    return {
+        "name": product.name,
+        "description": product.description,
+        "price": float(product.price),
+        "category_id": product.category_id,
+        "id": product.id,
+        "merchant_id": product.merchant_id,
+        "image_paths": urls,
+        "status": product.status,
+        "created_at": product.created_at,
+        "image_variants": _image_variants(urls),
+    }
+
+def product_json(product) -> bytes:
+    """JSON body for a product ORM object, as the response_model would render it"""
+    return orjson.dumps(product_dict(product))
+
+def products_json(products) -> bytes:
+    return orjson.dumps([product_dict(product) for product in products])
@@ -0,0 +1,42 @@
+"""
+商家商品目录版本
+
+merchants.catalog_version 在商家的商品发生任何变化（创建、修改、删除、
+图片上传/删除）时加一。版本号存放在数据库中，所有 worker 进程读到的
+都是同一个值，因此以 (merchant_id, catalog_version) 为键的缓存无需
+额外的失效通知：版本变化后旧条目自然不再命中。
+"""
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..cache import TTLCache
+from ..config import settings
+from ..models import Merchant
+from .product_retrieval import ProductIndex
+
+def _bump_statement(merchant_id: int):
+    return (
+        update(Merchant)
+        .where(Merchant.id == merchant_id)
+        .values(catalog_version=Merchant.catalog_version + 1)
+    )
+
+def bump_catalog_version(db: Session, merchant_id: int) -> None:
+    """Mark the merchant's catalog as changed; takes effect when ``db`` commits"""
+    db.execute(_bump_statement(merchant_id))
+
+async def bump_catalog_version_async(db: AsyncSession, merchant_id: int) -> None:
+    await db.execute(_bump_statement(merchant_id))
+
+# 聊天用的商品检索索引：(merchant_id, catalog_version) -> ProductIndex
+product_index_cache = TTLCache(
+    maxsize=settings.PRODUCT_INDEX_CACHE_SIZE,
+    ttl=settings.PRODUCT_INDEX_CACHE_TTL_SECONDS,
+)
+
+def get_cached_product_index(merchant: Merchant) -> Optional[ProductIndex]:
+    return product_index_cache.get((merchant.id, merchant.catalog_version))
+
+def cache_product_index(merchant: Merchant, index: ProductIndex) -> None:
+    product_index_cache.set((merchant.id, merchant.catalog_version), index)
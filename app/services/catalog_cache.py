@@ -0,0 +1,95 @@
+"""
+商品目录读接口的响应缓存
+
+GET /api/products、/api/products/{id} 和 /api/search 是公开接口，读远多于写。
+这里缓存序列化好的 JSON 响应体（连同 X-Next-Cursor 等响应头），并按内容
+生成强 ETag，客户端带 If-None-Match 重新验证时直接返回 304。
+
+商品的任何写操作都要调用 invalidate_product：该商品的详情缓存被精确清除；
+列表和搜索结果可能包含任意商品，因此全部清空。失效消息随事务提交后
+广播到所有 worker 进程（见 app/cache.py）。
+"""
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..cache import TTLCache, invalidation_bus
+from ..config import settings
+
+NAMESPACE = "catalog"
+
+# 响应体不变时客户端仍需重新验证，由 ETag 决定是否返回 304
+CACHE_CONTROL = "no-cache"
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+product_cache = TTLCache(
+    maxsize=settings.CATALOG_CACHE_SIZE,
+    ttl=settings.CATALOG_CACHE_TTL_SECONDS,
+)
+listing_cache = TTLCache(
+    maxsize=settings.CATALOG_CACHE_SIZE,
+    ttl=settings.CATALOG_CACHE_TTL_SECONDS,
+)
+
+# 每次失效加一；查询开始前后代数不同的结果可能已过期，不写入缓存
+_generation = 0
+_generation_lock = threading.Lock()
+
+def _on_invalidate(product_id: Optional[str]) -> None:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    listing_cache.clear()
+    if product_id is None:
+        product_cache.clear()
+    else:
+        product_cache.pop(int(product_id))
+
+invalidation_bus.subscribe(NAMESPACE, _on_invalidate)
+
+def invalidate_product(db: Session, product_id: int) -> None:
+    """Drop cached responses showing the product; broadcast when ``db`` commits"""
+    invalidation_bus.publish(db, NAMESPACE, product_id)
+
+async def invalidate_product_async(db: AsyncSession, product_id: int) -> None:
+    await invalidation_bus.publish_async(db, NAMESPACE, product_id)
+
+def cached_json(
+    cache: TTLCache,
+    key: Hashable,
+    render: Callable[[], Any],
+) -> CachedResponse:
+    """Cached response for ``key``, rendering it on a miss.
+
+    ``render`` returns the JSON body, or a ``(body, headers)`` tuple.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation = _generation
+    rendered = render()
+    body, headers = rendered if isinstance(rendered, tuple) else (rendered, {})
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    cached = CachedResponse(body=body, etag=etag, headers=headers)
+    if generation == _generation:
+        cache.set(key, cached)
+    return cached
+
+def conditional_response(request: Request, cached: CachedResponse) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL, **cached.headers}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and cached.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def stats() -> Dict[str, Any]:
+    return {"products": product_cache.stats(), "listings": listing_cache.stats()}
@@ -0,0 +1,151 @@
+"""
+聊天多轮记忆
+
+发给模型的历史由两部分组成：最近若干轮原始对话（窗口），以及更早
+对话压缩成的摘要（chat_sessions.summary）。窗口外的对话每累计
+CHAT_SUMMARY_BATCH 轮合并进摘要一次，因此无论聊多久，提示词大小
+都有上限：摘要 + 至多 CHAT_HISTORY_TURNS + CHAT_SUMMARY_BATCH - 1 轮。
+积压较多时（例如功能上线前的长对话）按 CHAT_SUMMARY_MAX_TURNS 分批合并。
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..models import ChatHistory, ChatSession
+from .deepseek_service import deepseek_service
+
+@dataclass
+class ChatMemory:
+    summary: str = ""
+    turns: List[ChatHistory] = field(default_factory=list)  # 从旧到新
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def messages(self) -> List[Dict[str, str]]:
+        """History to send before the new user message"""
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation with this customer:\n{self.summary}"
+            })
+        for turn in self.turns:
+            for message in turn.messages:
+                messages.append({
+                    "role": message["role"],
+                    "content": message["content"][:settings.CHAT_MESSAGE_MAX_CHARS],
+                })
+        return messages
+
+def _unsummarized_turns(user_id: int, merchant_id: int, summarized_until: int):
+    return (
+        select(ChatHistory)
+        .where(
+            ChatHistory.user_id == user_id,
+            ChatHistory.merchant_id == merchant_id,
+            ChatHistory.id > summarized_until,
+        )
+        .order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc())
+    )
+
+async def _get_session(db: AsyncSession, user_id: int, merchant_id: int) -> Optional[ChatSession]:
+    result = await db.execute(select(ChatSession).where(
+        ChatSession.user_id == user_id,
+        ChatSession.merchant_id == merchant_id,
+    ))
+    return result.scalar_one_or_none()
+
+async def load_memory(db: AsyncSession, user_id: int, merchant_id: int) -> ChatMemory:
+    session = await _get_session(db, user_id, merchant_id)
+    summarized_until = session.summarized_until if session else 0
+    window = settings.CHAT_HISTORY_TURNS + settings.CHAT_SUMMARY_BATCH - 1
+    result = await db.execute(_unsummarized_turns(user_id, merchant_id, summarized_until).limit(window))
+    turns = list(reversed(result.scalars().all()))
+    return ChatMemory(summary=session.summary if session else "", turns=turns)
+
+def _fallback_summary(summary: str, turns: List[ChatHistory]) -> str:
+    """Extractive summary used when the model is unavailable: keep the latest lines"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        for message in turn.messages:
+            lines.append(f"{message['role']}: {message['content'][:200]}")
+    return "\n".join(lines)[-settings.CHAT_SUMMARY_MAX_CHARS:]
+
+def _turns_to_fold(user_id: int, merchant_id: int, summarized_until: int, window_ids: List[int]):
+    return (
+        select(ChatHistory)
+        .where(
+            ChatHistory.user_id == user_id,
+            ChatHistory.merchant_id == merchant_id,
+            ChatHistory.id > summarized_until,
+            ChatHistory.id.not_in(window_ids),
+        )
+        .order_by(ChatHistory.created_at, ChatHistory.id)
+        .limit(settings.CHAT_SUMMARY_MAX_TURNS)
+    )
+
+async def compact_memory(db: AsyncSession, user_id: int, merchant_id: int) -> None:
+    """Fold turns that fell out of the window into the summary, once a batch has built up.
+
+    Older turns are folded oldest first, at most CHAT_SUMMARY_MAX_TURNS per
+    summary request, so a long backlog never goes to the model in one piece.
+    """
+    session = await _get_session(db, user_id, merchant_id)
+    summary = session.summary if session else ""
+    summarized_until = session.summarized_until if session else 0
+    result = await db.execute(
+        _unsummarized_turns(user_id, merchant_id, summarized_until)
+        .limit(settings.CHAT_HISTORY_TURNS)
+    )
+    window_ids = [turn.id for turn in result.scalars().all()]
+
+    while True:
+        result = await db.execute(_turns_to_fold(user_id, merchant_id, summarized_until, window_ids))
+        old_turns = list(result.scalars().all())
+        if len(old_turns) < settings.CHAT_SUMMARY_BATCH:
+            return
+
+        transcript = [
+            {"role": message["role"], "content": message["content"][:settings.CHAT_MESSAGE_MAX_CHARS]}
+            for turn in old_turns for message in turn.messages
+        ]
+        folded = await deepseek_service.summarize(summary, transcript, settings.CHAT_SUMMARY_MAX_CHARS)
+        if not folded:
+            folded = _fallback_summary(summary, old_turns)
+        summary = folded[:settings.CHAT_SUMMARY_MAX_CHARS]
+        summarized_until = old_turns[-1].id
+
+        # 每批提交一次，中途失败时已合并的部分不会重做
+        values = {
+            "summary": summary,
+            "summarized_until": summarized_until,
+            "updated_at": datetime.utcnow(),
+        }
+        await db.execute(
+            insert(ChatSession)
+            .values(user_id=user_id, merchant_id=merchant_id, **values)
+            .on_conflict_do_update(constraint="uq_chat_sessions_user_merchant", set_=values)
+        )
+        await db.commit()
+
+async def reset_memory(db: AsyncSession, user_id: int, merchant_id: int) -> None:
+    """Start a new conversation: earlier turns are neither summarized nor replayed"""
+    result = await db.execute(
+        select(ChatHistory.id)
+        .where(ChatHistory.user_id == user_id, ChatHistory.merchant_id == merchant_id)
+        .order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc())
+        .limit(1)
+    )
+    last_id = result.scalar_one_or_none() or 0
+    values = {"summary": "", "summarized_until": last_id, "updated_at": datetime.utcnow()}
+    await db.execute(
+        insert(ChatSession)
+        .values(user_id=user_id, merchant_id=merchant_id, **values)
+        .on_conflict_do_update(constraint="uq_chat_sessions_user_merchant", set_=values)
+    )
+    await db.commit()
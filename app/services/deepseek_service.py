@@ -1,28 +1,117 @@
+import asyncio
+import json
+import random
 import httpx
-from typing import List, Dict
+from typing import AsyncIterator, Hashable, List, Dict, Optional
+from ..cache import CoalescingCache
 from ..config import settings
-from ..models import Product
+from .circuit_breaker import CircuitBreaker
+
+# 可重试的上游状态码：限流和服务端错误
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+UNAVAILABLE_MESSAGE = "The shopping assistant is temporarily unavailable. Please try again later."
+
+class DeepSeekUnavailable(Exception):
+    """The upstream kept failing, or the circuit breaker is open"""
 
 class DeepSeekService:
-    def __init__(self):
-        self.api_key = settings.DEEPSEEK_API_KEY
-        self.api_url = settings.DEEPSEEK_API_URL
-
-    async def generate_product_context(self, products: List[Product]) -> str:
-        """Generate context string from merchant's products"""
-        if not products:
-            return "No products available."
-
-        context = "Available products:\n"
-        for product in products:
-            context += f"- {product.name}: {product.description or 'No description'} (Price: ${product.price})\n"
-        return context
-
-    async def chat(self, messages: List[Dict[str, str]], product_context: str) -> str:
-        """Send chat request to DeepSeek API"""
-        if not self.api_key:
-            return "DeepSeek API key not configured. Please contact the administrator."
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_key = settings.DEEPSEEK_API_KEY if api_key is None else api_key
+        self.api_url = api_url or settings.DEEPSEEK_API_URL
+        self.max_concurrency = max_concurrency or settings.DEEPSEEK_MAX_CONCURRENCY
+        self.max_retries = settings.DEEPSEEK_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = settings.DEEPSEEK_BACKOFF_SECONDS if backoff_base is None else backoff_base
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.DEEPSEEK_BREAKER_FAILURES,
+            reset_timeout=settings.DEEPSEEK_BREAKER_RESET_SECONDS,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # 相同问题的回答：(merchant_id, catalog_version, 规范化问题) -> 回复
+        self.answer_cache = CoalescingCache(
+            maxsize=settings.CHAT_ANSWER_CACHE_SIZE,
+            ttl=settings.CHAT_ANSWER_CACHE_TTL_SECONDS,
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # 每个 worker 进程一个长连接客户端，复用 TCP/TLS 连接
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.DEEPSEEK_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60.0,
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+        delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("Retry-After", "")))
+            except ValueError:
+                pass
+        return min(delay, settings.DEEPSEEK_BACKOFF_MAX_SECONDS)
 
+    async def _send(self, payload: dict, stream: bool = False) -> httpx.Response:
+        """POST to the API with retries and the circuit breaker.
+
+        Callers hold the concurrency semaphore. With ``stream=True`` only the
+        response headers have been read and the caller must close the response.
+        """
+        if not self.breaker.allow():
+            raise DeepSeekUnavailable("circuit open")
+
+        client = self._get_client()
+        try:
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    request = client.build_request("POST", self.api_url, json=payload)
+                    response = await client.send(request, stream=stream)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                        break
+                    await response.aclose()
+                await asyncio.sleep(self._backoff(attempt, response))
+        except httpx.TransportError as e:
+            self.breaker.record_failure()
+            raise DeepSeekUnavailable(str(e)) from e
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        if response.status_code in RETRYABLE_STATUS:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _build_messages(self, messages: List[Dict[str, str]], product_context: str) -> List[Dict[str, str]]:
         # Prepare system message with product context
         system_message = {
             "role": "system",
@@ -30,28 +119,108 @@ class DeepSeekService:
         }
 
         # Combine system message with user messages
-        full_messages = [system_message] + messages
+        return [system_message] + messages
+
+    async def _complete(self, messages: List[Dict[str, str]], product_context: str) -> str:
+        async with self._semaphore:
+            response = await self._send({
+                "model": "deepseek-chat",
+                "messages": self._build_messages(messages, product_context),
+                "temperature": 0.7
+            })
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def chat(self, messages: List[Dict[str, str]], product_context: str,
+                   cache_key: Optional[Hashable] = None) -> str:
+        """Send chat request to DeepSeek API.
+
+        With ``cache_key`` the reply is shared: answered from the cache, or
+        from a call already in flight for the same key. Errors are not cached.
+        """
+        if not self.api_key:
+            return "DeepSeek API key not configured. Please contact the administrator."
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "deepseek-chat",
-                        "messages": full_messages,
-                        "temperature": 0.7
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+            if cache_key is None:
+                return await self._complete(messages, product_context)
+            return await self.answer_cache.get_or_call(
+                cache_key, lambda: self._complete(messages, product_context)
+            )
+        except DeepSeekUnavailable:
+            return UNAVAILABLE_MESSAGE
         except httpx.HTTPStatusError as e:
             return f"Error communicating with DeepSeek API: {e.response.status_code}"
         except Exception as e:
             return f"Error: {str(e)}"
 
+    async def chat_stream(self, messages: List[Dict[str, str]], product_context: str) -> AsyncIterator[str]:
+        """Stream the reply from DeepSeek API, yielding content deltas as they arrive.
+
+        Raises DeepSeekUnavailable or httpx errors; the caller reports them to the client.
+        A stream that ends without ``[DONE]`` was cut off and raises DeepSeekUnavailable
+        after the deltas received so far, so a partial reply is never taken as complete.
+        """
+        if not self.api_key:
+            yield "DeepSeek API key not configured. Please contact the administrator."
+            return
+
+        async with self._semaphore:
+            response = await self._send({
+                "model": "deepseek-chat",
+                "messages": self._build_messages(messages, product_context),
+                "temperature": 0.7,
+                "stream": True
+            }, stream=True)
+            try:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    try:
+                        delta = json.loads(data)["choices"][0]["delta"].get("content")
+                    except (ValueError, KeyError, IndexError):
+                        continue
+                    if delta:
+                        yield delta
+                # 上游连接在 [DONE] 之前关闭，回复不完整
+                raise DeepSeekUnavailable("stream ended before [DONE]")
+            finally:
+                await response.aclose()
+
+    async def summarize(self, summary: str, messages: List[Dict[str, str]], max_chars: int) -> Optional[str]:
+        """Merge older conversation turns into a running summary; None if the API fails"""
+        if not self.api_key:
+            return None
+
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = (
+            f"Existing summary:\n{summary or '(none)'}\n\n"
+            f"New conversation turns:\n{transcript}\n\n"
+            f"Update the summary of this furniture shopping conversation. Keep the customer's needs, "
+            f"budget, preferences and the products discussed. Answer in the customer's language, "
+            f"in at most {max_chars} characters."
+        )
+        try:
+            async with self._semaphore:
+                response = await self._send({
+                    "model": "deepseek-chat",
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": 0.3
+                })
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"].strip()
+        except Exception:
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "circuit_breaker": self.breaker.stats(),
+            "answer_cache": self.answer_cache.stats(),
+        }
+
 deepseek_service = DeepSeekService()
@@ -0,0 +1,163 @@
+"""
+写接口的幂等键
+
+移动端网络不稳定时会重试下单、加购物车等请求。客户端为每次操作生成一个
+Idempotency-Key 请求头，重试时带上同一个键：
+
+- 处理请求时先在业务事务里插入该键（begin），业务写入完成后把响应体写进
+  同一行（complete），随业务数据一起提交；失败回滚时键也随之消失，重试会
+  重新执行。
+- 重试命中已提交的键时直接返回保存的响应，不再执行业务逻辑。
+- 两个相同的请求同时到达时，后者的插入会等待前者的事务结束，然后回放
+  前者的结果，不会重复执行。
+- 同一个键用于不同的接口或请求体时返回 422。
+
+只保存成功的响应；键在 IDEMPOTENCY_KEY_TTL_SECONDS 后过期，由后台任务定期清理。
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PURGE_BATCH_SIZE = 1000
+
+def request_hash(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode("utf-8")).hexdigest()
+
+def begin(
+    db: Session,
+    user_id: int,
+    key: Optional[str],
+    endpoint: str,
+    payload: BaseModel,
+) -> Optional[Response]:
+    """Claim ``key`` in the current transaction.
+
+    Returns the stored response when the request was already handled (the
+    caller must return it as is), or None when the caller should handle the
+    request and then call ``complete``. Without a key this is a no-op.
+    """
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters"
+        )
+
+    digest = request_hash(payload)
+    now = datetime.utcnow()
+    statement = insert(IdempotencyKey).values(
+        user_id=user_id,
+        key=key,
+        endpoint=endpoint,
+        request_hash=digest,
+        created_at=now,
+        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+    )
+    # 已过期但还没清理的键视为不存在
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+        set_={
+            "endpoint": statement.excluded.endpoint,
+            "request_hash": statement.excluded.request_hash,
+            "status_code": None,
+            "response_body": None,
+            "created_at": statement.excluded.created_at,
+            "expires_at": statement.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at < now,
+    ).returning(IdempotencyKey.key)
+    if db.execute(statement).first() is not None:
+        return None
+
+    stored = db.execute(
+        select(
+            IdempotencyKey.endpoint,
+            IdempotencyKey.request_hash,
+            IdempotencyKey.status_code,
+            IdempotencyKey.response_body,
+        ).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).one()
+    if stored.endpoint != endpoint or stored.request_hash != digest:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+        )
+    if stored.status_code is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"A request with this {IDEMPOTENCY_HEADER} is still being processed"
+        )
+    return Response(
+        content=stored.response_body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+def complete(
+    db: Session,
+    user_id: int,
+    key: Optional[str],
+    body: bytes,
+    status_code: int = status.HTTP_200_OK,
+) -> Response:
+    """Store the response for ``key`` in the current transaction and return it.
+
+    The caller commits afterwards, so the response becomes visible to
+    retries together with the writes it describes.
+    """
+    if key is not None:
+        db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status_code=status_code, response_body=body)
+            .execution_options(synchronize_session=False)
+        )
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+def purge_expired() -> int:
+    """Delete expired keys in small batches; returns how many were removed"""
+    removed = 0
+    with SessionLocal() as db:
+        while True:
+            expired = (
+                select(IdempotencyKey.user_id, IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at < datetime.utcnow())
+                .limit(PURGE_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            result = db.execute(
+                delete(IdempotencyKey)
+                .where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            removed += result.rowcount
+            if result.rowcount < PURGE_BATCH_SIZE:
+                return removed
+
+async def purge_periodically() -> None:
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS)
+        try:
+            removed = await asyncio.to_thread(purge_expired)
+            if removed:
+                logger.info("Purged %d expired idempotency keys", removed)
+        except Exception:
+            logger.exception("Failed to purge expired idempotency keys")
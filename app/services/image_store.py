@@ -0,0 +1,119 @@
+"""
+按内容寻址的图片存储
+
+图片按 SHA-256 存放在 UPLOAD_DIR/objects/ab/<sha256>.<ext>，相同内容只存
+一份；image_blobs 表记录每份内容被 products.image_paths 引用的次数。
+内容不变 URL 就不变，因此可以长期缓存。
+
+引用计数的增减都在业务事务里完成，并持有该行的行锁：
+- 上传：upsert 计数加一，然后把临时文件原子地改名到目标路径；
+- 删除：计数减一，降到零时删除该行，并把文件改名为墓碑（仍在事务中），
+  提交后再真正删除墓碑，提交失败则改回原名。
+同一内容的并发上传会等删除事务结束再写入文件，不会被误删。
+
+功能上线前上传的 products/{id}/{uuid}.ext 图片没有引用计数，删除时
+照旧直接删除文件。
+"""
+import os
+import uuid
+from typing import Dict, List, Tuple
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models import ImageBlob
+from .image_variants import variant_paths
+
+OBJECTS_DIR = "objects"
+
+def object_path(digest: str, ext: str) -> str:
+    """Relative path of the stored object for a SHA-256 hex digest"""
+    return f"{OBJECTS_DIR}/{digest[:2]}/{digest}{ext.lower()}"
+
+def is_object_path(path: str) -> bool:
+    return path.startswith(OBJECTS_DIR + "/")
+
+def _digest(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+def temp_upload_path() -> str:
+    """Path for an upload being received, outside the public /uploads tree"""
+    # 接收完成后 os.replace 到对象路径，要求与 UPLOAD_DIR 在同一文件系统
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f"{uuid.uuid4()}.part")
+
+def _acquire_statement(digest: str, ext: str, size: int):
+    statement = insert(ImageBlob).values(
+        sha256=digest, path=object_path(digest, ext), size=size, ref_count=1
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[ImageBlob.sha256],
+        set_={"ref_count": ImageBlob.ref_count + 1},
+    ).returning(ImageBlob.path, ImageBlob.ref_count)
+
+async def acquire_image_async(db: AsyncSession, digest: str, ext: str, size: int) -> Tuple[str, bool]:
+    """Add a reference to the content; returns its path and whether it is new.
+
+    The caller must then move the received file into place with
+    ``place_object`` before committing.
+    """
+    result = await db.execute(_acquire_statement(digest, ext, size))
+    path, ref_count = result.one()
+    return path, ref_count == 1
+
+def place_object(temp_path: str, path: str) -> None:
+    """Atomically move a received upload to its object path (idempotent for equal content)"""
+    full_path = os.path.join(settings.UPLOAD_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    os.replace(temp_path, full_path)
+
+def _stash(full_path: str, stashed: List[Tuple[str, str]]) -> None:
+    # 改名为墓碑，提交后删除，回滚时恢复
+    for path in [full_path, *variant_paths(full_path).values()]:
+        tombstone = f"{path}.deleted-{uuid.uuid4().hex}"
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            continue
+        stashed.append((tombstone, path))
+
+def _counts(paths: List[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for path in paths:
+        counts[path] = counts.get(path, 0) + 1
+    return counts
+
+def release_images(db: Session, paths: List[str]) -> List[Tuple[str, str]]:
+    """Drop references to ``paths`` (one per occurrence) in the current transaction.
+
+    Files no longer referenced are moved aside; pass the returned list to
+    ``purge_released`` after committing, or ``restore_released`` on failure.
+    """
+    stashed: List[Tuple[str, str]] = []
+    for path, count in sorted(_counts(paths).items()):
+        if is_object_path(path):
+            ref_count = db.execute(
+                update(ImageBlob)
+                .where(ImageBlob.sha256 == _digest(path))
+                .values(ref_count=ImageBlob.ref_count - count)
+                .returning(ImageBlob.ref_count)
+            ).scalar_one_or_none()
+            if ref_count is None or ref_count > 0:
+                continue
+            db.execute(delete(ImageBlob).where(ImageBlob.sha256 == _digest(path)))
+        _stash(os.path.join(settings.UPLOAD_DIR, path), stashed)
+    return stashed
+
+def purge_released(stashed: List[Tuple[str, str]]) -> None:
+    for tombstone, _ in stashed:
+        try:
+            os.remove(tombstone)
+        except FileNotFoundError:
+            pass
+
+def restore_released(stashed: List[Tuple[str, str]]) -> None:
+    for tombstone, path in reversed(stashed):
+        try:
+            os.rename(tombstone, path)
+        except FileNotFoundError:
+            pass
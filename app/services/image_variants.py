@@ -0,0 +1,120 @@
+"""
+商品图片衍生图
+
+上传原图后，在独立的进程池里生成若干宽度的 WebP 缩略图，与原图放在
+同一目录，文件名按约定生成：
+
+    products/5/<uuid>.jpg  ->  products/5/<uuid>_thumb.webp
+                               products/5/<uuid>_medium.webp
+                               products/5/<uuid>_large.webp
+
+因为路径可以直接由原图路径推出，数据库里只保存原图路径。衍生图生成
+完成之前，对它们的请求由 /uploads 回退到原图（见 app/static_files.py）。
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 允许上传的原图格式
+ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+# 名称 -> 最大宽度（像素），不放大比它小的原图
+VARIANT_WIDTHS = {"thumb": 320, "medium": 800, "large": 1600}
+VARIANT_FORMAT = "webp"
+WEBP_QUALITY = 80
+
+_VARIANT_SUFFIXES = {name: f"_{name}.{VARIANT_FORMAT}" for name in VARIANT_WIDTHS}
+
+def _strip_extension(path: str) -> str:
+    # 文件名不以点开头时与 os.path.splitext 结果相同；商品列表序列化时逐条调用，避免其开销
+    dot = path.rfind(".")
+    return path[:dot] if dot > path.rfind("/") + 1 else path
+
+def variant_path(path: str, name: str) -> str:
+    """Path (or URL) of a variant, derived from the original's path (or URL)"""
+    return _strip_extension(path) + _VARIANT_SUFFIXES[name]
+
+def variant_paths(path: str) -> Dict[str, str]:
+    base = _strip_extension(path)
+    return {name: base + suffix for name, suffix in _VARIANT_SUFFIXES.items()}
+
+def original_for_variant(path: str) -> Optional[str]:
+    """Stem of the original for a variant path, or None if ``path`` is not a variant.
+
+    The original's extension is not recorded in the variant name, so callers
+    look for ``<stem>.*`` next to it.
+    """
+    base, ext = os.path.splitext(path)
+    if ext != f".{VARIANT_FORMAT}":
+        return None
+    for name in VARIANT_WIDTHS:
+        if base.endswith(f"_{name}"):
+            return base[:-len(name) - 1]
+    return None
+
+def generate_variants(source: str) -> List[str]:
+    """Write every variant of ``source``; runs in a worker process"""
+    from PIL import Image, ImageOps
+
+    written = []
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for name, width in VARIANT_WIDTHS.items():
+            variant = image.copy()
+            variant.thumbnail((width, width * 4))
+            target = variant_path(source, name)
+            # 先写临时文件再改名，避免对外提供写了一半的图片
+            partial = target + ".part"
+            variant.save(partial, format=VARIANT_FORMAT, quality=WEBP_QUALITY, method=4)
+            os.replace(partial, target)
+            written.append(target)
+    return written
+
+def remove_variants(source: str) -> None:
+    for target in variant_paths(source).values():
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn：不继承父进程的数据库连接和监听线程
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=get_context("spawn"),
+        )
+    return _executor
+
+async def _generate(source: str) -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_get_executor(), generate_variants, source)
+    except Exception:
+        logger.exception("Failed to generate image variants for %s", source)
+
+_pending = set()
+
+def schedule_variants(sources: List[str]) -> None:
+    """Generate variants in the background; the originals are served meanwhile"""
+    for source in sources:
+        task = asyncio.ensure_future(_generate(source))
+        # 保留引用，避免任务在完成前被回收
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,254 @@
+"""
+商品库存
+
+每个商品的可售库存拆成 INVENTORY_SHARDS 行（inventory_shards），总和即库存。
+秒杀时大量订单同时扣减同一个商品，如果只有一行，所有下单事务都要排队等
+这一行的行锁；拆开后：
+
+- 快速路径：随机挑一个库存足够且没有被锁住的分片（FOR UPDATE SKIP LOCKED）
+  直接扣减，不同事务落在不同的行上，互不等待；分片都被锁住时随机排队
+  等其中一个，仍然只锁一行；
+- 慢速路径：没有单个分片够用时，按分片顺序锁住该商品的全部分片，从多个
+  分片凑出数量，总数不足返回 409。
+
+一个订单涉及多个商品时按商品 id 顺序扣减，避免事务之间互相等待形成死锁。
+
+下单即预留库存：订单记录每一行实际预留的数量（reserved_quantity）和
+保留截止时间（reserved_until）。下单时已从余额扣款，订单状态为待付款，
+等待商家处理；预留了库存的订单超过 INVENTORY_RESERVATION_TTL_SECONDS
+仍未被商家处理时，由后台任务取消订单、归还库存并退款，把库存放回给
+其他买家。没有预留库存的订单（包括功能上线前的订单）不会被自动取消。
+商家取消订单时同样退款，并只归还订单实际预留过的库存。
+
+没有分片行的商品不限库存（功能上线前创建的商品）；商家通过
+PUT /api/products/{id}/stock 设置库存后开始计数。
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from ..auth import invalidate_principal
+from ..config import settings
+from ..database import SessionLocal
+from ..models import InventoryShard, Order, OrderItem, OrderStatus, User
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 100
+# 没有空闲分片时，排队等待单个分片的次数（每次重新随机挑选）
+BLOCKING_ATTEMPTS = 3
+
+def split_quantity(quantity: int, shards: int) -> List[int]:
+    """Spread ``quantity`` as evenly as possible over ``shards`` rows"""
+    base, extra = divmod(quantity, shards)
+    return [base + (1 if shard < extra else 0) for shard in range(shards)]
+
+def get_stock(db: Session, product_id: int) -> Optional[int]:
+    """Available stock, or None when the product's stock is not tracked"""
+    return db.execute(
+        select(func.sum(InventoryShard.quantity)).where(InventoryShard.product_id == product_id)
+    ).scalar_one_or_none()
+
+def set_stock(db: Session, product_id: int, quantity: int) -> None:
+    """Replace the product's available stock with ``quantity``"""
+    # 先锁住现有分片，避免与进行中的扣减交错
+    db.execute(
+        select(InventoryShard.shard)
+        .where(InventoryShard.product_id == product_id)
+        .order_by(InventoryShard.shard)
+        .with_for_update()
+    ).all()
+    shards = settings.INVENTORY_SHARDS
+    statement = insert(InventoryShard).values([
+        {"product_id": product_id, "shard": shard, "quantity": share}
+        for shard, share in enumerate(split_quantity(quantity, shards))
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[InventoryShard.product_id, InventoryShard.shard],
+        set_={"quantity": statement.excluded.quantity},
+    ))
+    # 分片数调小后多出的行
+    db.execute(
+        update(InventoryShard)
+        .where(InventoryShard.product_id == product_id, InventoryShard.shard >= shards)
+        .values(quantity=0)
+        .execution_options(synchronize_session=False)
+    )
+
+def _take_from_one_shard(db: Session, product_id: int, quantity: int, skip_locked: bool) -> bool:
+    candidate = (
+        select(InventoryShard.shard)
+        .where(InventoryShard.product_id == product_id, InventoryShard.quantity >= quantity)
+        .order_by(func.random())
+        .limit(1)
+    )
+    if skip_locked:
+        candidate = candidate.with_for_update(skip_locked=True)
+    else:
+        # 等到的行被别的事务扣光时，UPDATE 不会修改它但仍持有行锁；在保存点中
+        # 执行，失败时回滚释放，否则之后按顺序锁全部分片时可能与别的事务死锁
+        savepoint = db.begin_nested()
+    taken = db.execute(
+        update(InventoryShard)
+        .where(
+            InventoryShard.product_id == product_id,
+            InventoryShard.shard == candidate.scalar_subquery(),
+            # 等到行锁后重新检查，期间可能被别的事务扣光
+            InventoryShard.quantity >= quantity,
+        )
+        .values(quantity=InventoryShard.quantity - quantity)
+        .returning(InventoryShard.shard)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if not skip_locked:
+        if taken is None:
+            savepoint.rollback()
+        else:
+            savepoint.commit()
+    return taken is not None
+
+def _take_across_shards(db: Session, product_id: int, quantity: int) -> None:
+    shards = db.execute(
+        select(InventoryShard.shard, InventoryShard.quantity)
+        .where(InventoryShard.product_id == product_id)
+        .order_by(InventoryShard.shard)
+        .with_for_update()
+    ).all()
+    if sum(row.quantity for row in shards) < quantity:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Insufficient stock for product {product_id}"
+        )
+    remaining = quantity
+    for row in sorted(shards, key=lambda row: -row.quantity):
+        if remaining == 0:
+            break
+        take = min(row.quantity, remaining)
+        db.execute(
+            update(InventoryShard)
+            .where(InventoryShard.product_id == product_id, InventoryShard.shard == row.shard)
+            .values(quantity=InventoryShard.quantity - take)
+            .execution_options(synchronize_session=False)
+        )
+        remaining -= take
+
+def reserve(db: Session, quantities: Dict[int, int]) -> Dict[int, int]:
+    """Take stock for every product in the current transaction.
+
+    Raises HTTPException 409 when a product does not have enough stock;
+    products whose stock is not tracked are skipped. Returns the quantities
+    actually taken, keyed by product id.
+    """
+    tracked = db.execute(
+        select(InventoryShard.product_id)
+        .where(InventoryShard.product_id.in_(quantities))
+        .distinct()
+    ).scalars().all()
+    for product_id in sorted(tracked):
+        quantity = quantities[product_id]
+        # 先找没被锁住的分片；都被锁住时排队等其中一个，仍不够再跨分片凑
+        if _take_from_one_shard(db, product_id, quantity, skip_locked=True):
+            continue
+        if any(_take_from_one_shard(db, product_id, quantity, skip_locked=False) for _ in range(BLOCKING_ATTEMPTS)):
+            continue
+        _take_across_shards(db, product_id, quantity)
+    return {product_id: quantities[product_id] for product_id in tracked}
+
+def release(db: Session, quantities: Dict[int, int]) -> None:
+    """Return stock to the products in the current transaction"""
+    for product_id in sorted(quantities):
+        # 还到随机的分片上，与扣减一样分散行锁
+        shard = (
+            select(InventoryShard.shard)
+            .where(InventoryShard.product_id == product_id)
+            .order_by(func.random())
+            .limit(1)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(InventoryShard)
+            .where(InventoryShard.product_id == product_id, InventoryShard.shard == shard)
+            .values(quantity=InventoryShard.quantity + quantities[product_id])
+            .execution_options(synchronize_session=False)
+        )
+
+def cancel_orders(db: Session, order_ids, from_statuses: Iterable[OrderStatus]) -> List[int]:
+    """Cancel the orders still in one of ``from_statuses``: release their reserved stock and refund the buyers.
+
+    ``order_ids`` may be a list or a subquery. Orders in any other status are
+    left untouched, so concurrent cancellations never refund twice. Returns
+    the ids of the orders that were cancelled.
+    """
+    cancelled = db.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.status.in_(list(from_statuses)))
+        .values(status=OrderStatus.CANCELLED, reserved_until=None, updated_at=datetime.utcnow())
+        .returning(Order.id, Order.user_id, Order.total_price)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not cancelled:
+        return []
+    ids = [row.id for row in cancelled]
+
+    # 只归还下单时实际预留的数量；设置库存之前下的订单没有预留
+    quantities = dict(db.execute(
+        select(OrderItem.product_id, func.sum(OrderItem.reserved_quantity))
+        .where(OrderItem.order_id.in_(ids), OrderItem.reserved_quantity > 0)
+        .group_by(OrderItem.product_id)
+    ).all())
+    release(db, quantities)
+
+    refunds: Dict[int, float] = defaultdict(float)
+    for row in cancelled:
+        refunds[row.user_id] += row.total_price
+    for user_id in sorted(refunds):
+        username = db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(balance=User.balance + refunds[user_id])
+            .returning(User.username)
+            .execution_options(synchronize_session=False)
+        ).scalar_one()
+        invalidate_principal(db, username)
+    return ids
+
+def reservation_deadline() -> datetime:
+    """``reserved_until`` for an order that reserves stock now"""
+    return datetime.utcnow() + timedelta(seconds=settings.INVENTORY_RESERVATION_TTL_SECONDS)
+
+def expired_reservations():
+    """Orders still awaiting the merchant whose stock reservation has run out"""
+    # SKIP LOCKED：多个 worker 同时清理时各取不同的订单
+    return (
+        select(Order.id)
+        .where(Order.status == OrderStatus.PENDING_PAYMENT, Order.reserved_until < datetime.utcnow())
+        .order_by(Order.reserved_until)
+        .limit(SWEEP_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+
+def release_expired_reservations() -> int:
+    """Cancel and refund orders whose stock reservation expired; returns how many"""
+    total = 0
+    with SessionLocal() as db:
+        while True:
+            cancelled = cancel_orders(db, expired_reservations(), [OrderStatus.PENDING_PAYMENT])
+            db.commit()
+            total += len(cancelled)
+            if len(cancelled) < SWEEP_BATCH_SIZE:
+                return total
+
+async def sweep_periodically() -> None:
+    while True:
+        await asyncio.sleep(settings.INVENTORY_SWEEP_INTERVAL_SECONDS)
+        try:
+            cancelled = await asyncio.to_thread(release_expired_reservations)
+            if cancelled:
+                logger.info("Cancelled %d orders whose stock reservation expired", cancelled)
+        except Exception:
+            logger.exception("Failed to release expired stock reservations")
@@ -0,0 +1,114 @@
+"""
+聊天商品检索
+
+商家商品很多时不能把整个目录都放进提示词。这里为每个商家的在售商品
+建立一个内存中的 TF-IDF 倒排索引（分词规则与 search_index 相同：中文
+一元 + 二元组，英文按词），按用户消息挑出最相关的 top-k 个商品，并在
+token 预算内渲染成提示词。提示词大小只取决于 k 和预算，与目录规模无关。
+
+索引按 (merchant_id, catalog_version) 缓存，目录变化后自动重建。
+"""
+import itertools
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from .search_index import document_terms
+
+# 商品名中的词条权重高于描述
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+# 单个商品描述在提示词中的最大长度
+DESCRIPTION_MAX_CHARS = 200
+
+# 中日韩文字及全角标点
+_CJK_CHAR_RE = re.compile("[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+class ProductEntry(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters"""
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def format_product_line(product) -> str:
+    description = product.description or "No description"
+    if len(description) > DESCRIPTION_MAX_CHARS:
+        description = description[:DESCRIPTION_MAX_CHARS] + "..."
+    return f"- {product.name}: {description} (Price: ${product.price})\n"
+
+class ProductIndex:
+    """TF-IDF index over one merchant's online products"""
+
+    def __init__(self, products: Sequence[ProductEntry]):
+        self.products = list(products)  # 按上架时间从新到旧
+        self.lines = [format_product_line(product) for product in self.products]
+        self.line_tokens = [estimate_tokens(line) for line in self.lines]
+
+        weights: List[Counter] = []
+        document_frequency: Counter = Counter()
+        for product in self.products:
+            tf: Counter = Counter()
+            for term in document_terms(product.name):
+                tf[term] += NAME_WEIGHT
+            for term in document_terms(product.description):
+                tf[term] += DESCRIPTION_WEIGHT
+            weights.append(tf)
+            document_frequency.update(tf.keys())
+
+        total = len(self.products)
+        self._postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for position, tf in enumerate(weights):
+            for term, weight in tf.items():
+                idf = math.log((1 + total) / (1 + document_frequency[term])) + 1.0
+                self._postings[term].append((position, weight * idf))
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def rank(self, text: str) -> List[int]:
+        """Positions of products matching ``text``, most relevant first"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in document_terms(text):
+            for position, score in self._postings.get(term, ()):
+                scores[position] += score
+        return sorted(scores, key=lambda position: (-scores[position], position))
+
+    def select(self, text: str, top_k: int, token_budget: int) -> List[int]:
+        """Up to ``top_k`` relevant products whose lines fit in ``token_budget``.
+
+        When fewer than ``top_k`` products match, the newest products fill
+        the remaining slots so the assistant always has something to offer.
+        """
+        ranked = self.rank(text)
+        matched = set(ranked)
+        newest = (p for p in range(len(self.products)) if p not in matched)
+
+        selected, used = [], 0
+        for position in itertools.chain(ranked, newest):
+            if len(selected) >= top_k or used >= token_budget:
+                break
+            if used + self.line_tokens[position] > token_budget:
+                continue
+            selected.append(position)
+            used += self.line_tokens[position]
+        return selected
+
+    def render(self, text: str, top_k: int, token_budget: int) -> str:
+        """Product context for the system prompt"""
+        if not self.products:
+            return "No products available."
+
+        selected = self.select(text, top_k, token_budget)
+        if len(selected) == len(self.products):
+            header = "Available products:\n"
+        else:
+            header = (
+                f"Available products (the {len(selected)} of {len(self.products)} "
+                f"most relevant to the customer's question):\n"
+            )
+        return header + "".join(self.lines[position] for position in selected)
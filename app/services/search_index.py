@@ -0,0 +1,92 @@
+"""
+商品全文检索
+
+PostgreSQL 自带的分词器无法切分中文，因此分词在应用内完成：
+中文按字切成一元 + 二元组（n-gram），英文/数字按词切分。
+分好的词条直接写入 products.search_vector（tsvector，GIN 索引），
+查询时构造同样规则的 tsquery，由索引完成匹配，ts_rank 计算相关度。
+"""
+import re
+import unicodedata
+from typing import List, Optional, Iterable
+from sqlalchemy import func, cast, literal, Text
+from sqlalchemy.dialects.postgresql import ARRAY, TSQUERY
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[0-9a-z]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+# 单个词条的最大长度，避免超长英文串撑大索引
+MAX_TERM_LENGTH = 64
+
+def _normalize(text: str) -> str:
+    # NFKC 将全角字母数字折叠为半角
+    return unicodedata.normalize("NFKC", text).lower()
+
+def _runs(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(_normalize(text))
+
+def _bigrams(run: str) -> List[str]:
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+def _unique(terms: Iterable[str]) -> List[str]:
+    seen = {}
+    for term in terms:
+        if term and term not in seen:
+            seen[term] = None
+    return list(seen)
+
+def document_terms(text: Optional[str]) -> List[str]:
+    """Index terms for a document: CJK unigrams and bigrams, plus whole latin words"""
+    terms = []
+    for run in _runs(text):
+        if _CJK_RE.match(run):
+            terms.extend(run)
+            terms.extend(_bigrams(run))
+        else:
+            terms.append(run[:MAX_TERM_LENGTH])
+    return _unique(terms)
+
+def query_terms(text: Optional[str]) -> List[str]:
+    """Terms a query must match.
+
+    A CJK run matches through its bigrams (a single character through its
+    unigram), which is equivalent to a substring match on the original text.
+    """
+    terms = []
+    for run in _runs(text):
+        if _CJK_RE.match(run):
+            terms.extend(_bigrams(run) if len(run) > 1 else [run])
+        else:
+            terms.append(run[:MAX_TERM_LENGTH])
+    return _unique(terms)
+
+def _terms_vector(terms: List[str], weight: str):
+    return func.setweight(func.array_to_tsvector(cast(terms, ARRAY(Text))), weight)
+
+def search_vector_expression(name: Optional[str], description: Optional[str]):
+    """SQL expression for products.search_vector; name terms outrank description terms"""
+    return _terms_vector(document_terms(name), "A").op("||")(
+        _terms_vector(document_terms(description), "B")
+    )
+
+def _quote(term: str) -> str:
+    return "'" + term.replace("\\", "\\\\").replace("'", "''") + "'"
+
+def build_tsquery(text: Optional[str]):
+    """tsquery requiring every query term; latin words also match as prefixes.
+
+    The query text is cast directly to tsquery so the lexemes are used
+    verbatim, exactly as they were written into the index.
+    Returns None when the text contains no searchable terms.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return None
+    parts = [
+        _quote(term) if _CJK_RE.match(term) else _quote(term) + ":*"
+        for term in terms
+    ]
+    return cast(literal(" & ".join(parts)), TSQUERY)
@@ -0,0 +1,174 @@
+"""
+/uploads 静态文件
+
+上传的图片按内容寻址（见 services/image_store.py），旧图片也是 UUID 文件名，
+同一 URL 的内容永不改变，因此：
+- 强 ETag：按内容存储的图片直接用 SHA-256，其余用大小 + 修改时间；
+- Cache-Control: immutable，客户端和 CDN 可以长期缓存而无需重新验证；
+- 支持单段 Range 请求（206/416）和 If-Range；
+- 可选把文件传输交给前置代理（STATIC_OFFLOAD）：nginx 的 X-Accel-Redirect
+  或 Apache/lighttpd 的 X-Sendfile，Python 进程只返回响应头。
+
+图片格式本身已经压缩，不再提供 gzip/br 预压缩版本；需要更小的文件时
+使用 WebP 衍生图（image_variants）。
+"""
+import mimetypes
+import os
+import re
+import stat
+from typing import Optional, Tuple
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+from .config import settings
+from .services.image_store import is_object_path
+from .services.image_variants import ALLOWED_EXTENSIONS, original_for_variant
+
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={settings.STATIC_CACHE_MAX_AGE}, immutable"
+
+OFFLOAD_MODES = {"", "x-accel-redirect", "x-sendfile"}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive byte range for a single-range ``Range`` header.
+
+    Returns None when the header should be ignored (malformed or multi-range,
+    which is then answered with the whole file) and raises HTTPException 416
+    when the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # 后缀范围：最后 N 个字节
+        length = int(last)
+        if length == 0 or size == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that sends only bytes ``start``..``end`` (inclusive) with status 206"""
+
+    def __init__(self, path: str, start: int, end: int, stat_result: os.stat_result, **kwargs):
+        super().__init__(path, status_code=206, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # 文件在发送过程中被截断
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class UploadStaticFiles(StaticFiles):
+    """Serves /uploads with strong ETags, immutable caching, ranges and optional proxy offload.
+
+    A request for an image variant that has not been generated yet is
+    answered with the original image, without long-term caching.
+    """
+
+    def __init__(self, *args, offload: Optional[str] = None, offload_prefix: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.offload = (settings.STATIC_OFFLOAD if offload is None else offload).lower()
+        self.offload_prefix = settings.STATIC_OFFLOAD_PREFIX if offload_prefix is None else offload_prefix
+        if self.offload not in OFFLOAD_MODES:
+            raise ValueError(f"Unknown STATIC_OFFLOAD mode: {self.offload}")
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        try:
+            return await super().get_response(path, scope)
+        except HTTPException as e:
+            stem = original_for_variant(path) if e.status_code == 404 else None
+            if stem is None:
+                raise
+            for ext in sorted(ALLOWED_EXTENSIONS):
+                for candidate in (stem + ext, stem + ext.upper()):
+                    full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, candidate)
+                    if stat_result and stat.S_ISREG(stat_result.st_mode):
+                        # 衍生图生成后 URL 不变，回退的响应不能被长期缓存
+                        return self.file_response(full_path, stat_result, scope, immutable=False)
+            raise
+
+    def etag(self, relative_path: str, stat_result: os.stat_result) -> str:
+        if is_object_path(relative_path) and original_for_variant(relative_path) is None:
+            # 文件名就是内容的 SHA-256
+            return '"' + os.path.splitext(os.path.basename(relative_path))[0] + '"'
+        return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+        immutable: bool = True,
+    ) -> Response:
+        relative_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        request_headers = Headers(scope=scope)
+        etag = self.etag(relative_path, stat_result)
+        headers = {
+            "etag": etag,
+            "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else "no-cache",
+            "accept-ranges": "bytes",
+        }
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        ):
+            return Response(status_code=304, headers=headers)
+
+        if self.offload and status_code == 200:
+            return self.offload_response(relative_path, full_path, headers)
+
+        byte_range = None
+        range_header = request_headers.get("range")
+        if range_header and status_code == 200:
+            # If-Range 与当前 ETag 不符时忽略 Range，返回完整的新内容
+            if_range = request_headers.get("if-range")
+            if if_range is None or if_range.strip() == etag:
+                byte_range = parse_range(range_header, stat_result.st_size)
+
+        if byte_range is not None:
+            return RangeFileResponse(full_path, *byte_range, stat_result=stat_result, headers=headers)
+        return FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+
+    def offload_response(self, relative_path: str, full_path, headers: dict) -> Response:
+        """Empty response telling the front proxy which file to send.
+
+        The proxy then serves the bytes (and any Range request) itself,
+        keeping the ETag and Cache-Control set here.
+        """
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        if self.offload == "x-accel-redirect":
+            headers["x-accel-redirect"] = self.offload_prefix.rstrip("/") + "/" + relative_path
+        else:
+            headers["x-sendfile"] = os.path.abspath(full_path)
+        return Response(status_code=200, headers=headers, media_type=media_type)
@@ -0,0 +1,102 @@
+"""
+热门商品库存扣减基准测试
+
+在配置的 PostgreSQL 数据库上，对同一个商品并发执行“扣 1 件库存 + 提交”的事务，
+分别用 1 个分片（等同于单行计数器）和多个分片运行，比较吞吐量和延迟。
+--hold-ms 模拟下单事务在扣库存之后的其余工作（扣余额、写订单等），
+期间分片行锁一直被持有，这正是单行计数器排队的原因。
+
+    python bench_inventory.py --requests 2000 --concurrency 16 --shards 1 8 --hold-ms 5
+
+运行结束后检查库存恰好扣完，并删除测试商品。
+"""
+import argparse
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from sqlalchemy import delete, text
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User, UserRole, Merchant, Product, ProductStatus
+from app.services import inventory
+
+def create_product():
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        seller = User(username=f"bench_inv_{tag}", email=f"bench_inv_{tag}@example.com",
+                      password_hash="x", role=UserRole.MERCHANT)
+        db.add(seller)
+        db.flush()
+        merchant = Merchant(user_id=seller.id, shop_name=f"bench_inv_{tag}")
+        db.add(merchant)
+        db.flush()
+        product = Product(merchant_id=merchant.id, name=f"bench_inv_{tag}", price=1.0,
+                          image_paths=[], status=ProductStatus.ONLINE)
+        db.add(product)
+        db.commit()
+        return seller.id, merchant.id, product.id
+
+def remove_product(seller_id, merchant_id, product_id):
+    with SessionLocal() as db:
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(Merchant).where(Merchant.id == merchant_id))
+        db.execute(delete(User).where(User.id == seller_id))
+        db.commit()
+
+def run(args, shards):
+    settings.INVENTORY_SHARDS = shards
+    seller_id, merchant_id, product_id = create_product()
+    try:
+        with SessionLocal() as db:
+            inventory.set_stock(db, product_id, args.requests)
+            db.commit()
+
+        latencies, failed = [], 0
+
+        def one(_):
+            nonlocal failed
+            start = time.perf_counter()
+            with SessionLocal() as db:
+                try:
+                    inventory.reserve(db, {product_id: 1})
+                except HTTPException:
+                    failed += 1
+                    return
+                if args.hold_ms:
+                    db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": args.hold_ms / 1000})
+                db.commit()
+            latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        with SessionLocal() as db:
+            remaining = inventory.get_stock(db, product_id)
+        ordered = sorted(latencies)
+        print(f"shards {shards}:")
+        print(f"  reserved:     {len(latencies)}  failed: {failed}  stock left: {remaining}")
+        print(f"  throughput:   {len(latencies) / elapsed:.1f} reservations/s")
+        if ordered:
+            print(f"  latency p50:  {statistics.median(ordered) * 1000:.1f}ms")
+            print(f"  latency p99:  {ordered[int(len(ordered) * 0.99) - 1] * 1000:.1f}ms")
+    finally:
+        remove_product(seller_id, merchant_id, product_id)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, settings.INVENTORY_SHARDS])
+    parser.add_argument("--hold-ms", type=float, default=5.0, help="time each transaction keeps its lock")
+    args = parser.parse_args()
+
+    print(f"requests: {args.requests} (concurrency {args.concurrency}, hold {args.hold_ms}ms)")
+    for shards in args.shards:
+        run(args, shards)
+
+if __name__ == "__main__":
+    main()
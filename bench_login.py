@@ -0,0 +1,97 @@
+"""
+登录吞吐量基准测试
+
+默认在进程内模拟登录洪峰：并发调用 password_hasher.verify，统计吞吐量、
+延迟分位数、被限流（503）的请求数，以及同期事件循环的最大卡顿时间
+（反映其他路由是否被拖慢）。
+
+    python bench_login.py --requests 500 --concurrency 100
+
+指定 --url 时对运行中的服务发起真实登录请求（需先注册好对应用户）：
+
+    python bench_login.py --url http://localhost:8000 --username test --password 123456
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+from fastapi import HTTPException
+from app.auth import password_hasher
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list):
+    """Record how late a 10ms timer fires while the benchmark runs"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - start - 0.01)
+
+async def run(args, attempt):
+    latencies, rejected, failed = [], 0, 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        nonlocal rejected, failed
+        async with semaphore:
+            start = time.perf_counter()
+            outcome = await attempt()
+            if outcome == 200:
+                latencies.append(time.perf_counter() - start)
+            elif outcome == 503:
+                rejected += 1
+            else:
+                failed += 1
+
+    stop, lag = asyncio.Event(), []
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    print(f"requests:     {args.requests} (concurrency {args.concurrency})")
+    print(f"succeeded:    {len(latencies)}  rejected(503): {rejected}  failed: {failed}")
+    print(f"elapsed:      {elapsed:.2f}s")
+    print(f"throughput:   {len(latencies) / elapsed:.1f} logins/s")
+    if latencies:
+        ordered = sorted(latencies)
+        print(f"latency p50:  {statistics.median(ordered) * 1000:.1f}ms")
+        print(f"latency p99:  {ordered[int(len(ordered) * 0.99) - 1] * 1000:.1f}ms")
+    if lag:
+        print(f"loop lag max: {max(lag) * 1000:.1f}ms")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--url", help="Base URL of a running server")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench-password")
+    args = parser.parse_args()
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60.0,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            async def attempt():
+                response = await client.post("/api/auth/login", json={
+                    "username": args.username, "password": args.password
+                })
+                return response.status_code
+            await run(args, attempt)
+        return
+
+    print(f"bcrypt rounds: {password_hasher.rounds}")
+    hashed = password_hasher.hash_sync(args.password)
+
+    async def attempt():
+        try:
+            ok = await password_hasher.verify(args.password, hashed)
+        except HTTPException as e:
+            return e.status_code
+        return 200 if ok else 401
+
+    await run(args, attempt)
+
+if __name__ == "__main__":
+    asyncio.run(main())
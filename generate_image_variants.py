@@ -0,0 +1,41 @@
+"""
+为已上传的商品图片生成缩略图（WebP）
+
+新上传的图片会自动生成；此脚本用于回填功能上线前上传的图片，
+已存在衍生图的原图会跳过，可重复运行。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from app.config import settings
+from app.services.image_variants import (
+    ALLOWED_EXTENSIONS, generate_variants, original_for_variant, variant_paths
+)
+
+def find_originals(root):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+                continue
+            if original_for_variant(path) is not None:
+                continue
+            if all(os.path.exists(p) for p in variant_paths(path).values()):
+                continue
+            yield path
+
+def main():
+    originals = list(find_originals(os.path.join(settings.UPLOAD_DIR, "products")))
+    print(f"待处理图片: {len(originals)}")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {path: executor.submit(generate_variants, path) for path in originals}
+        for path, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {path}: {e}")
+    print(f"✅ 完成，失败 {failed} 张")
+
+if __name__ == "__main__":
+    main()
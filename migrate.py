@@ -0,0 +1,201 @@
+"""
+数据库迁移
+
+migrations/ 目录下的文件按编号顺序执行，已执行的版本记录在
+schema_migrations 表中，每个文件只执行一次：
+
+- NNNN_name.sql：默认整个文件和版本记录在同一个事务中执行；
+  首行为 `-- migrate: no-transaction` 的文件逐条语句自动提交执行，
+  用于 CREATE INDEX CONCURRENTLY（建索引期间不锁表，不能在事务中执行）。
+  这类文件中的语句都应可重复执行，中途失败后重新运行即可。
+- NNNN_name.py：定义 upgrade(engine)，用于需要应用代码的数据迁移，
+  以及需要分批提交的大表回填（update_in_batches）。
+
+迁移不能长时间锁住线上的表：
+- 回填按主键分批，每批单独提交，不在一个事务里改整张表；
+- 给已有的列加 NOT NULL 分三步：先加 CHECK (col IS NOT NULL) NOT VALID
+  （只短暂加锁，之后的写入立即受约束），再在另一个迁移中 VALIDATE CONSTRAINT
+  （扫描全表但不阻塞读写），最后 SET NOT NULL（有已验证的 CHECK 时不再
+  扫表）并删除 CHECK；外键同样先 NOT VALID 再 VALIDATE。
+- 要求新代码写入的约束（如新列的 NOT NULL CHECK）要等所有实例都部署了
+  新代码之后再执行：先 --target 执行到约束之前的版本，部署，再执行其余迁移。
+
+并发建索引失败会留下一个无效索引，IF NOT EXISTS 会把它当作已存在；
+重新执行前先删除同名的无效索引。
+
+新表由应用启动时的 SQLAlchemy create_all 创建，这里只处理已有表的变更。
+
+用法：
+    python migrate.py            # 执行所有未执行的迁移
+    python migrate.py --status   # 查看迁移状态
+    python migrate.py --target 0013   # 只执行到 0013（含）为止
+"""
+import argparse
+import hashlib
+import importlib.util
+import os
+import re
+from sqlalchemy import create_engine, text
+from app.config import settings
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# 防止多个进程同时执行迁移
+ADVISORY_LOCK_ID = 720_020
+
+BATCH_SIZE = 1000
+
+_FILENAME_RE = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)",
+    re.IGNORECASE,
+)
+
+def discover():
+    """(version, name, path) of every migration file, in order"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME_RE.match(filename)
+        if match:
+            migrations.append((match.group(1), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise SystemExit("❌ 迁移版本号重复")
+    return migrations
+
+def checksum(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def split_statements(sql: str):
+    """Statements of a migration file; each must end with ``;`` at the end of a line"""
+    statements = []
+    for chunk in re.split(r";[ \t]*(?:\n|$)", sql):
+        lines = [line for line in chunk.splitlines() if not line.strip().startswith("--")]
+        statement = "\n".join(lines).strip()
+        if statement:
+            statements.append(statement)
+    return statements
+
+def execute_concurrently(conn, statement: str) -> None:
+    """Run one statement on an autocommit connection.
+
+    An invalid index left behind by a failed concurrent build is dropped
+    first, so that IF NOT EXISTS does not skip rebuilding it.
+    """
+    match = _CONCURRENT_INDEX_RE.search(statement)
+    if match:
+        invalid = conn.execute(text("""
+            SELECT 1 FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+        """), {"name": match.group(1)}).first()
+        if invalid:
+            print(f"  删除上次未建完的无效索引 {match.group(1)}")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}"))
+    conn.exec_driver_sql(statement)
+
+def update_in_batches(engine, table: str, statement: str, batch_size: int = BATCH_SIZE) -> int:
+    """Run an UPDATE over ``table`` one primary-key range at a time, committing after each.
+
+    ``statement`` must restrict itself to ``id BETWEEN :first_id AND :last_id``.
+    Returns the number of rows updated.
+    """
+    total = 0
+    last_id = 0
+    with engine.connect() as conn:
+        while True:
+            ids = conn.execute(
+                text(f"SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).scalars().all()
+            if not ids:
+                return total
+            total += conn.execute(text(statement), {"first_id": ids[0], "last_id": ids[-1]}).rowcount
+            conn.commit()
+            last_id = ids[-1]
+
+def ensure_table(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                checksum VARCHAR NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """))
+
+def applied_migrations(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT version, checksum FROM schema_migrations")).all()
+    return {row.version: row.checksum for row in rows}
+
+def record(conn, version: str, name: str, digest: str) -> None:
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, checksum) VALUES (:version, :name, :checksum)"),
+        {"version": version, "name": name, "checksum": digest},
+    )
+
+def apply(engine, version: str, name: str, path: str) -> None:
+    digest = checksum(path)
+    if path.endswith(".py"):
+        spec = importlib.util.spec_from_file_location(f"migration_{version}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(engine)
+        with engine.begin() as conn:
+            record(conn, version, name, digest)
+        return
+
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for statement in split_statements(sql):
+                execute_concurrently(conn, statement)
+            record(conn, version, name, digest)
+    else:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(sql)
+            record(conn, version, name, digest)
+
+def migrate(status_only: bool = False, target: str = None) -> None:
+    engine = create_engine(settings.DATABASE_URL)
+    ensure_table(engine)
+    migrations = discover()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+        try:
+            applied = applied_migrations(engine)
+            pending = 0
+            for version, name, path in migrations:
+                if target is not None and int(version) > int(target):
+                    break
+                if version in applied:
+                    if applied[version] != checksum(path):
+                        print(f"⚠️  {version}_{name} 执行后已被修改，不会重新执行")
+                    elif status_only:
+                        print(f"✅ {version}_{name}")
+                    continue
+                pending += 1
+                if status_only:
+                    print(f"⏳ {version}_{name}")
+                    continue
+                print(f"▶️  {version}_{name}")
+                apply(engine, version, name, path)
+                print(f"✅ {version}_{name}")
+            if not status_only and pending == 0:
+                print("数据库已是最新")
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ADVISORY_LOCK_ID})
+    engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending database migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    parser.add_argument("--target", metavar="VERSION", help="apply migrations up to and including VERSION only")
+    args = parser.parse_args()
+    migrate(status_only=args.status, target=args.target)
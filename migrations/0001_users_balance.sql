@@ -0,0 +1,3 @@
+-- 用户账户余额（默认 10000000 元）
+ALTER TABLE users
+ADD COLUMN IF NOT EXISTS balance FLOAT NOT NULL DEFAULT 10000000.0;
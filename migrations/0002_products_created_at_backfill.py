@@ -0,0 +1,13 @@
+"""
+商品列表/搜索游标分页按 (created_at, id) 排序，created_at 不能为空
+
+第一步：按主键分批补齐为空的 created_at，之后由 0003、0004 加上非空约束。
+"""
+from migrate import update_in_batches
+
+def upgrade(engine):
+    total = update_in_batches(engine, "products", """
+        UPDATE products SET created_at = NOW()
+        WHERE id BETWEEN :first_id AND :last_id AND created_at IS NULL
+    """)
+    print(f"✅ 补齐了 {total} 个商品的 created_at")
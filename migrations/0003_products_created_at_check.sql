@@ -0,0 +1,3 @@
+-- 先以 NOT VALID 加约束：只短暂加锁、不扫描已有的行，新写入的行立即受约束
+ALTER TABLE products
+ADD CONSTRAINT products_created_at_not_null CHECK (created_at IS NOT NULL) NOT VALID;
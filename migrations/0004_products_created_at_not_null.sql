@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- VALIDATE 扫描已有的行，期间不阻塞读写；有已验证的 CHECK 约束时
+-- SET NOT NULL 不再扫表，只短暂加锁。之后 CHECK 约束就多余了。
+-- 每条语句都可重复执行：约束已删除时跳过 VALIDATE
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'products_created_at_not_null') THEN ALTER TABLE products VALIDATE CONSTRAINT products_created_at_not_null; END IF; END
+$$;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE products DROP CONSTRAINT IF EXISTS products_created_at_not_null;
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- 游标分页排序键
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_created_at_id
+    ON products (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_status_created_at_id
+    ON products (status, created_at, id);
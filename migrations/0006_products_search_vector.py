@@ -0,0 +1,62 @@
+"""
+商品全文检索列
+
+1. 添加 products.search_vector 列
+2. 按批次用应用内分词器（支持中文）回填现有商品，每批一条 UPDATE
+3. 并发创建 GIN 索引（不锁表）
+"""
+from sqlalchemy import text, select
+from app.models import Product
+from app.services.search_index import document_terms
+from migrate import execute_concurrently, BATCH_SIZE
+
+# 与 search_vector_expression 相同：名称词条权重 A，描述词条权重 B。
+# 词条不含空格，每个商品的词条用空格连接后整批作为数组传入
+BACKFILL_BATCH = text("""
+    UPDATE products AS product
+    SET search_vector =
+        setweight(array_to_tsvector(string_to_array(batch.name_terms, ' ')), 'A')
+        || setweight(array_to_tsvector(string_to_array(batch.description_terms, ' ')), 'B')
+    FROM unnest(
+        CAST(:ids AS integer[]), CAST(:name_terms AS text[]), CAST(:description_terms AS text[])
+    ) AS batch (id, name_terms, description_terms)
+    WHERE product.id = batch.id
+""")
+
+def upgrade(engine):
+    with engine.connect() as conn:
+        conn.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR"))
+        conn.commit()
+        print("✅ 成功添加search_vector列")
+
+        # 按主键分批回填，每批单独提交，避免长事务
+        last_id = 0
+        total = 0
+        while True:
+            rows = conn.execute(
+                select(Product.id, Product.name, Product.description)
+                .where(Product.id > last_id)
+                .order_by(Product.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            conn.execute(BACKFILL_BATCH, {
+                "ids": [row.id for row in rows],
+                "name_terms": [" ".join(document_terms(row.name)) for row in rows],
+                "description_terms": [" ".join(document_terms(row.description)) for row in rows],
+            })
+            conn.commit()
+            last_id = rows[-1].id
+            total += len(rows)
+            print(f"  已回填 {total} 个商品")
+        print(f"✅ 成功回填 {total} 个商品的检索词条")
+
+    # CREATE INDEX CONCURRENTLY 不能在事务中执行
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        execute_concurrently(
+            conn,
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_search_vector "
+            "ON products USING gin (search_vector)",
+        )
+        print("✅ 成功创建全文检索索引")
@@ -0,0 +1,3 @@
+-- 商家商品目录版本（聊天商品索引缓存的失效依据）
+ALTER TABLE merchants
+ADD COLUMN IF NOT EXISTS catalog_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- 聊天多轮记忆按会话读取最近几轮对话；也覆盖只按 (user_id, merchant_id) 的查询
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_history_user_merchant_created
+    ON chat_history (user_id, merchant_id, created_at);
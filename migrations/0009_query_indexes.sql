@@ -0,0 +1,18 @@
+-- migrate: no-transaction
+-- 在售商品按分类、价格筛选（搜索接口）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_status_category_price
+    ON products (status, category_id, price);
+
+-- 商家自己的商品
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_merchant_id
+    ON products (merchant_id);
+
+-- 商家订单（按商品反查订单项）和订单详情（按订单加载订单项）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_product_id
+    ON order_items (product_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_order_id
+    ON order_items (order_id);
+
+-- 我的订单，按下单时间倒序
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_user_created
+    ON orders (user_id, created_at);
@@ -0,0 +1,20 @@
+-- 同一购物车中每个商品只保留一行：把重复行的数量合并到 id 最小的一行，
+-- 删除其余的行。合并和删除在同一个事务中，并锁住表禁止其间的写入，
+-- 失败时整体回滚，不会重复累加数量，也不会删掉没被合并的新行。
+LOCK TABLE cart_items IN SHARE ROW EXCLUSIVE MODE;
+
+UPDATE cart_items AS kept
+SET quantity = merged.quantity
+FROM (
+    SELECT MIN(id) AS id, SUM(quantity) AS quantity
+    FROM cart_items
+    GROUP BY cart_id, product_id
+    HAVING COUNT(*) > 1
+) AS merged
+WHERE kept.id = merged.id;
+
+DELETE FROM cart_items AS duplicate
+USING cart_items AS kept
+WHERE duplicate.cart_id = kept.cart_id
+  AND duplicate.product_id = kept.product_id
+  AND duplicate.id > kept.id;
@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- 重复行已由 0010 合并。如果建索引时报重复键，说明合并之后旧版本的服务
+-- 又写入了重复行：从 schema_migrations 删除 0010 的记录后重新运行迁移。
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_cart_items_cart_product
+    ON cart_items (cart_id, product_id);
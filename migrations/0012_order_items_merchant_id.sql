@@ -0,0 +1,14 @@
+-- 订单项记录下单时商品所属的商家，商家订单列表不必再经由商品表反查。
+-- 先加可空的列；外键以 NOT VALID 添加，不扫描已有的行，只短暂加锁。
+-- 旧版本的服务不写这一列，仍可正常下单，空值由 0013、0014 补齐
+ALTER TABLE order_items ADD COLUMN IF NOT EXISTS merchant_id INTEGER;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'order_items_merchant_id_fkey') THEN
+        ALTER TABLE order_items
+        ADD CONSTRAINT order_items_merchant_id_fkey
+        FOREIGN KEY (merchant_id) REFERENCES merchants (id) NOT VALID;
+    END IF;
+END
+$$;
@@ -0,0 +1,15 @@
+"""
+按商品所属的商家回填已有订单项的 merchant_id，按主键分批提交
+"""
+from migrate import update_in_batches
+
+def upgrade(engine):
+    total = update_in_batches(engine, "order_items", """
+        UPDATE order_items AS item
+        SET merchant_id = product.merchant_id
+        FROM products AS product
+        WHERE item.id BETWEEN :first_id AND :last_id
+          AND item.merchant_id IS NULL
+          AND product.id = item.product_id
+    """)
+    print(f"✅ 回填了 {total} 个订单项的商家")
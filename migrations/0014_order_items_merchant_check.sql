@@ -0,0 +1,11 @@
+-- 从这里开始要求写入 merchant_id：须在所有实例都部署了新代码之后执行
+-- （python migrate.py --target 0013 → 部署 → python migrate.py）。
+-- 先补齐部署期间旧实例写入的订单项（只锁这些行），再以 NOT VALID
+-- 加非空约束：不扫描已有的行，只短暂加锁，新写入的行立即受约束
+UPDATE order_items AS item
+SET merchant_id = product.merchant_id
+FROM products AS product
+WHERE item.merchant_id IS NULL AND product.id = item.product_id;
+
+ALTER TABLE order_items
+ADD CONSTRAINT order_items_merchant_id_not_null CHECK (merchant_id IS NOT NULL) NOT VALID;
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- VALIDATE 扫描已有的行，期间不阻塞读写；有已验证的 CHECK 约束时
+-- SET NOT NULL 不再扫表，只短暂加锁，之后删除多余的 CHECK 约束。
+-- 每条语句都可重复执行：约束已删除时跳过 VALIDATE
+ALTER TABLE order_items VALIDATE CONSTRAINT order_items_merchant_id_fkey;
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'order_items_merchant_id_not_null') THEN ALTER TABLE order_items VALIDATE CONSTRAINT order_items_merchant_id_not_null; END IF; END
+$$;
+ALTER TABLE order_items ALTER COLUMN merchant_id SET NOT NULL;
+ALTER TABLE order_items DROP CONSTRAINT IF EXISTS order_items_merchant_id_not_null;
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- 商家订单列表：DISTINCT order_id 按索引顺序读取，翻页按订单号定位
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_order_items_merchant_order
+    ON order_items (merchant_id, order_id);
@@ -0,0 +1,6 @@
+-- 订单记录下单时实际预留的库存：超时清理只处理预留了库存的订单，
+-- 取消时只归还预留过的数量。已有订单没有预留库存。
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS reserved_until TIMESTAMP;
+
+ALTER TABLE order_items
+ADD COLUMN IF NOT EXISTS reserved_quantity INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- 后台任务按预留截止时间查找超时的待付款订单，释放其预留的库存
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_status_reserved_until
+    ON orders (status, reserved_until);
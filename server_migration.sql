@@ -21,3 +21,8 @@ SELECT id, username, role, balance FROM users;
 -- 2. 订单、订单项表已通过SQLAlchemy自动创建
 -- 3. 所有其他表结构保持不变
 -- =============================================
+
+-- =============================================
+-- 之后的表结构变更和索引见 migrations/ 目录，
+-- 用 python migrate.py 执行（已执行的版本记录在 schema_migrations 表中）
+-- =============================================
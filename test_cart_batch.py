@@ -0,0 +1,89 @@
+"""
+购物车批量接口测试
+
+在配置的 PostgreSQL 数据库上运行（所有数据在事务中创建并最终回滚），
+确认批量接口的累加、设置、删除语义，以及 SQL 查询数量不随行数增长。
+
+    python test_cart_batch.py
+"""
+import json
+from fastapi import HTTPException
+from app.models import User, UserRole, Merchant, Product, ProductStatus
+from app.schemas import CartBatch
+from app.api.cart import update_cart_batch
+from test_order_queries import rollback_session, count_queries
+
+PRODUCTS = 20
+
+
+def create_fixture(session, tag):
+    buyer = User(username=f"cb_buyer_{tag}", email=f"cb_buyer_{tag}@example.com",
+                 password_hash="x", role=UserRole.USER)
+    seller = User(username=f"cb_seller_{tag}", email=f"cb_seller_{tag}@example.com",
+                  password_hash="x", role=UserRole.MERCHANT)
+    session.add_all([buyer, seller])
+    session.flush()
+    merchant = Merchant(user_id=seller.id, shop_name=f"cb_shop_{tag}")
+    session.add(merchant)
+    session.flush()
+    products = [
+        Product(merchant_id=merchant.id, name=f"cb_product_{tag}_{i}", price=10.0 + i,
+                image_paths=[], status=ProductStatus.ONLINE)
+        for i in range(PRODUCTS)
+    ]
+    session.add_all(products)
+    session.commit()
+    return buyer, [product.id for product in products]
+
+
+def apply(session, buyer, **batch):
+    response = update_cart_batch(batch=CartBatch(**batch), idempotency_key=None,
+                                 current_user=buyer, db=session)
+    return {item["product_id"]: item["quantity"] for item in json.loads(response.body)["items"]}
+
+
+def test_batch_upserts_updates_and_removes():
+    with rollback_session() as session:
+        buyer, ids = create_fixture(session, "semantics")
+        cart = apply(session, buyer, add=[{"product_id": ids[0], "quantity": 1},
+                                          {"product_id": ids[1], "quantity": 2},
+                                          {"product_id": ids[2], "quantity": 3}])
+        assert cart == {ids[0]: 1, ids[1]: 2, ids[2]: 3}, cart
+
+        cart = apply(session, buyer,
+                     add=[{"product_id": ids[0], "quantity": 4}],
+                     update=[{"product_id": ids[1], "quantity": 7}, {"product_id": ids[3], "quantity": 0}],
+                     remove=[ids[2]])
+        assert cart == {ids[0]: 5, ids[1]: 7}, cart
+
+        for batch in ({"add": [{"product_id": ids[0], "quantity": 0}]},
+                      {"add": [{"product_id": ids[0], "quantity": 1}], "remove": [ids[0]]},
+                      {"update": [{"product_id": -1, "quantity": 1}]}):
+            try:
+                apply(session, buyer, **batch)
+            except HTTPException as e:
+                assert e.status_code in (400, 404)
+            else:
+                raise AssertionError(f"batch {batch} was accepted")
+        print("✓ Batch adds to, sets and removes cart lines; invalid batches are refused")
+
+
+def test_batch_query_count_is_constant():
+    counts = []
+    for lines in (1, PRODUCTS):
+        with rollback_session() as session:
+            buyer, ids = create_fixture(session, f"count_{lines}")
+            with count_queries(session) as statements:
+                apply(session, buyer, add=[{"product_id": i, "quantity": 1} for i in ids[:lines]])
+            counts.append(len(statements))
+    assert counts[0] == counts[1], f"{counts[0]} queries for 1 line, {counts[1]} for {PRODUCTS}"
+    print(f"✓ update_cart_batch: {counts[1]} queries for {PRODUCTS} lines")
+
+
+if __name__ == "__main__":
+    try:
+        test_batch_upserts_updates_and_removes()
+        test_batch_query_count_is_constant()
+    except AssertionError as e:
+        print(f"✗ Cart batch regression: {e}")
+        raise
@@ -0,0 +1,88 @@
+"""
+商品目录响应缓存测试：不需要数据库，失效消息直接交给 invalidation_bus 分发，
+与收到其他 worker 的通知时相同。
+
+    python test_catalog_cache.py
+"""
+import json
+from starlette.requests import Request
+from app.cache import invalidation_bus
+from app.services.catalog_cache import (
+    NAMESPACE, product_cache, listing_cache, cached_json, conditional_response,
+)
+
+
+def make_request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def render_product(product_id, name):
+    return lambda: json.dumps({"id": product_id, "name": name}).encode()
+
+
+def test_etag_is_stable_and_revalidates():
+    product_cache.clear()
+    first = cached_json(product_cache, 1, render_product(1, "北欧实木床"))
+    product_cache.clear()
+    again = cached_json(product_cache, 1, render_product(1, "北欧实木床"))
+    changed = cached_json(product_cache, 2, render_product(1, "布艺沙发"))
+    assert first.etag == again.etag, (first.etag, again.etag)
+    assert first.etag != changed.etag
+
+    response = conditional_response(make_request(), first)
+    assert response.status_code == 200 and response.body == first.body
+    assert response.headers["etag"] == first.etag
+    for header in (first.etag, f"W/{first.etag}", f'"stale", {first.etag}'):
+        response = conditional_response(make_request(header), first)
+        assert response.status_code == 304 and response.body == b"", header
+        assert response.headers["etag"] == first.etag
+    assert conditional_response(make_request(changed.etag), first).status_code == 200
+    print("✓ ETag depends only on the body; a matching If-None-Match gets 304")
+
+
+def test_invalidate_evicts_product_and_listings():
+    product_cache.clear()
+    listing_cache.clear()
+    cached_json(product_cache, 1, render_product(1, "北欧实木床"))
+    cached_json(product_cache, 2, render_product(2, "布艺沙发"))
+    cached_json(listing_cache, ("list", None), lambda: b"[]")
+
+    invalidation_bus._dispatch(NAMESPACE, "1")
+    assert product_cache.get(1) is None
+    assert product_cache.get(2) is not None, "other products stay cached"
+    assert listing_cache.get(("list", None)) is None, "listings may show any product"
+
+    renders = []
+    def render():
+        renders.append(1)
+        return render_product(1, "北欧实木床 v2")()
+    cached = cached_json(product_cache, 1, render)
+    assert json.loads(cached.body)["name"] == "北欧实木床 v2"
+    cached_json(product_cache, 1, render)
+    assert len(renders) == 1, "re-rendered response is cached again"
+
+    invalidation_bus._dispatch(NAMESPACE, None)
+    assert product_cache.get(1) is None and product_cache.get(2) is None
+    print("✓ Invalidation evicts the product and every listing")
+
+
+def test_invalidation_during_render_is_not_cached():
+    product_cache.clear()
+    def render():
+        # 查询期间商品被修改：结果可能已过期
+        invalidation_bus._dispatch(NAMESPACE, "1")
+        return render_product(1, "北欧实木床")()
+    cached = cached_json(product_cache, 1, render)
+    assert cached.body and product_cache.get(1) is None
+    print("✓ A response rendered across an invalidation is served but not cached")
+
+
+if __name__ == "__main__":
+    try:
+        test_etag_is_stable_and_revalidates()
+        test_invalidate_evicts_product_and_listings()
+        test_invalidation_during_render_is_not_cached()
+    except AssertionError as e:
+        print(f"✗ Catalog cache regression: {e}")
+        raise
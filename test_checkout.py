@@ -0,0 +1,145 @@
+"""
+下单并发正确性测试
+
+在配置的 PostgreSQL 数据库上运行。同一用户从多个线程同时下单，确认
+余额恰好扣到不足为止、不会扣成负数，订单按服务端价格计价；带同一个
+Idempotency-Key 重试（包括同时重试）只生成一个订单。测试数据需要真正
+提交才能被并发事务看到，结束时全部删除。
+
+    python test_checkout.py
+"""
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from sqlalchemy import delete
+from app.database import SessionLocal
+from app.models import User, UserRole, Merchant, Product, ProductStatus, Order, OrderItem, IdempotencyKey
+from app.schemas import OrderCreate
+from app.api.orders import create_order
+from app.services.idempotency import REPLAYED_HEADER
+
+PRICE = 100.0
+BALANCE = 1000.0
+ATTEMPTS = 25
+
+
+def create_fixture():
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        buyer = User(username=f"co_buyer_{tag}", email=f"co_buyer_{tag}@example.com",
+                     password_hash="x", role=UserRole.USER, balance=BALANCE)
+        seller = User(username=f"co_seller_{tag}", email=f"co_seller_{tag}@example.com",
+                      password_hash="x", role=UserRole.MERCHANT)
+        db.add_all([buyer, seller])
+        db.flush()
+        merchant = Merchant(user_id=seller.id, shop_name=f"co_shop_{tag}")
+        db.add(merchant)
+        db.flush()
+        product = Product(merchant_id=merchant.id, name=f"co_product_{tag}", price=PRICE,
+                          image_paths=[], status=ProductStatus.ONLINE)
+        db.add(product)
+        db.commit()
+        return buyer.id, seller.id, merchant.id, product.id
+
+
+def remove_fixture(buyer_id, seller_id, merchant_id, product_id):
+    with SessionLocal() as db:
+        order_ids = [order_id for (order_id,) in db.query(Order.id).filter(Order.user_id == buyer_id)]
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == buyer_id))
+        db.execute(delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+        db.execute(delete(Order).where(Order.id.in_(order_ids)))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(Merchant).where(Merchant.id == merchant_id))
+        db.execute(delete(User).where(User.id.in_([buyer_id, seller_id])))
+        db.commit()
+
+
+def checkout(buyer_id, product_id, price_at_purchase=None, idempotency_key=None, quantity=1):
+    """Placed order as a dict, or the error status code"""
+    with SessionLocal() as db:
+        buyer = db.get(User, buyer_id)
+        order_data = OrderCreate(items=[
+            {"product_id": product_id, "quantity": quantity, "price_at_purchase": price_at_purchase}
+        ])
+        try:
+            response = create_order(order_data=order_data, idempotency_key=idempotency_key,
+                                    current_user=buyer, db=db)
+        except HTTPException as e:
+            return e.status_code
+        order = json.loads(response.body)
+        order["replayed"] = response.headers.get(REPLAYED_HEADER) == "true"
+        return order
+
+
+def order_count(buyer_id):
+    with SessionLocal() as db:
+        return db.query(Order).filter(Order.user_id == buyer_id).count()
+
+
+def test_concurrent_checkouts_never_overdraw():
+    fixture = create_fixture()
+    buyer_id, _, _, product_id = fixture
+    try:
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda _: checkout(buyer_id, product_id), range(ATTEMPTS)))
+
+        placed = [result for result in results if not isinstance(result, int)]
+        rejected = [result for result in results if isinstance(result, int)]
+        assert len(placed) == int(BALANCE // PRICE), f"{len(placed)} orders placed"
+        assert set(rejected) == {400}, rejected
+        assert all(order["total_price"] == PRICE for order in placed)
+
+        with SessionLocal() as db:
+            assert db.get(User, buyer_id).balance == BALANCE - PRICE * len(placed)
+        print(f"✓ {ATTEMPTS} concurrent checkouts: {len(placed)} placed, balance never overdrawn")
+    finally:
+        remove_fixture(*fixture)
+
+
+def test_checkout_uses_server_prices():
+    fixture = create_fixture()
+    buyer_id, _, _, product_id = fixture
+    try:
+        assert checkout(buyer_id, product_id, price_at_purchase=1.0) == 409
+        order = checkout(buyer_id, product_id, price_at_purchase=PRICE)
+        assert order["total_price"] == PRICE and order["items"][0]["price_at_purchase"] == PRICE
+        print("✓ Orders are priced by the server; a stale client price is rejected with 409")
+    finally:
+        remove_fixture(*fixture)
+
+
+def test_retried_checkout_is_replayed():
+    fixture = create_fixture()
+    buyer_id, _, _, product_id = fixture
+    try:
+        first = checkout(buyer_id, product_id, idempotency_key="retry-1")
+        retry = checkout(buyer_id, product_id, idempotency_key="retry-1")
+        assert not first["replayed"] and retry["replayed"]
+        assert retry["id"] == first["id"]
+        assert checkout(buyer_id, product_id, idempotency_key="retry-1", quantity=2) == 422
+
+        # 同时到达的重试等待第一个请求提交后回放其结果
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(
+                lambda _: checkout(buyer_id, product_id, idempotency_key="retry-2"), range(8)
+            ))
+        assert len({order["id"] for order in results}) == 1, results
+        assert sum(not order["replayed"] for order in results) == 1
+
+        assert order_count(buyer_id) == 2
+        with SessionLocal() as db:
+            assert db.get(User, buyer_id).balance == BALANCE - 2 * PRICE
+        print("✓ Retries with the same Idempotency-Key replay the first order")
+    finally:
+        remove_fixture(*fixture)
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_checkouts_never_overdraw()
+        test_checkout_uses_server_prices()
+        test_retried_checkout_is_replayed()
+    except AssertionError as e:
+        print(f"✗ Checkout regression: {e}")
+        raise
@@ -0,0 +1,195 @@
+"""
+DeepSeekService 测试：在本地启动一个模拟 DeepSeek 接口的 HTTP 服务，
+验证长连接复用、429/5xx 重试和熔断行为，不需要真实的 API key。
+
+    python test_deepseek_stub.py
+"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.deepseek_service import DeepSeekService, DeepSeekUnavailable
+
+STUB_REPLY = "stub reply"
+STUB_CHUNKS = ["stub ", "streamed ", "reply"]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.client_ports.append(self.client_address[1])
+        status = self.server.script.pop(0) if self.server.script else self.server.default_status
+        if payload.get("stream") and status == 200:
+            self.send_stream()
+            return
+        body = json.dumps({"choices": [{"message": {"content": STUB_REPLY}}]}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in STUB_CHUNKS:
+            event = {"choices": [{"delta": {"content": chunk}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        if not self.server.truncate_stream:
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    def __init__(self, script=None, default_status=200):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.script = list(script or [])
+        self.httpd.default_status = default_status
+        self.httpd.client_ports = []
+        self.httpd.truncate_stream = False  # 流式回复不发送 [DONE]，模拟上游中途断开
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+
+    @property
+    def request_count(self):
+        return len(self.httpd.client_ports)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_service(server, **kwargs):
+    kwargs.setdefault("backoff_base", 0.0)
+    return DeepSeekService(api_key="test-key", api_url=server.url, **kwargs)
+
+
+async def chat(service):
+    return await service.chat([{"role": "user", "content": "hi"}], "No products available.")
+
+
+def test_retries_on_429_and_5xx():
+    async def run():
+        with StubServer(script=[503, 429]) as server:
+            service = make_service(server, max_retries=2)
+            reply = await chat(service)
+            await service.aclose()
+            assert reply == STUB_REPLY, reply
+            assert server.request_count == 3
+    asyncio.run(run())
+    print("✓ Retries 429/5xx and returns the eventual reply")
+
+
+def test_reuses_connection():
+    async def run():
+        with StubServer() as server:
+            service = make_service(server)
+            for _ in range(5):
+                assert await chat(service) == STUB_REPLY
+            await service.aclose()
+            assert len(set(server.httpd.client_ports)) == 1, server.httpd.client_ports
+    asyncio.run(run())
+    print("✓ Keeps one connection alive across chat turns")
+
+
+def test_circuit_breaker_fails_fast_and_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0, clock=lambda: now[0])
+
+    async def run():
+        with StubServer(default_status=500) as server:
+            service = make_service(server, max_retries=0, breaker=breaker)
+            await chat(service)
+            await chat(service)
+            assert breaker.state == CircuitBreaker.OPEN
+            requests_before = server.request_count
+            reply = await chat(service)
+            assert "temporarily unavailable" in reply, reply
+            assert server.request_count == requests_before, "open circuit must not call upstream"
+
+            # 冷却期结束后放行一次试探请求，成功则恢复
+            now[0] += 31.0
+            server.httpd.default_status = 200
+            assert await chat(service) == STUB_REPLY
+            assert breaker.state == CircuitBreaker.CLOSED
+            await service.aclose()
+    asyncio.run(run())
+    print("✓ Circuit breaker fails fast while open and closes after a successful trial")
+
+
+def test_stream_yields_deltas():
+    async def run():
+        with StubServer(script=[503]) as server:
+            service = make_service(server, max_retries=1)
+            chunks = [chunk async for chunk in service.chat_stream(
+                [{"role": "user", "content": "hi"}], "No products available."
+            )]
+            await service.aclose()
+            assert chunks == STUB_CHUNKS, chunks
+    asyncio.run(run())
+    print("✓ Streams reply deltas, retrying before the first byte")
+
+
+def test_stream_without_done_raises():
+    async def run():
+        with StubServer() as server:
+            server.httpd.truncate_stream = True
+            service = make_service(server)
+            chunks = []
+            try:
+                async for chunk in service.chat_stream([{"role": "user", "content": "hi"}], "No products available."):
+                    chunks.append(chunk)
+            except DeepSeekUnavailable:
+                pass
+            else:
+                raise AssertionError("truncated stream must not complete normally")
+            finally:
+                await service.aclose()
+            assert chunks == STUB_CHUNKS, chunks
+    asyncio.run(run())
+    print("✓ A stream cut off before [DONE] raises instead of ending as a complete reply")
+
+
+def test_answer_cache_coalesces_identical_questions():
+    async def run():
+        with StubServer(script=[500]) as server:
+            service = make_service(server, max_retries=0)
+            key = (1, 0, "do you have a solid wood bed")
+
+            # 失败不缓存
+            reply = await service.chat([{"role": "user", "content": "hi"}], "", cache_key=key)
+            assert "500" in reply, reply
+
+            replies = await asyncio.gather(*[
+                service.chat([{"role": "user", "content": "hi"}], "", cache_key=key) for _ in range(5)
+            ])
+            assert replies == [STUB_REPLY] * 5, replies
+            assert server.request_count == 2, server.request_count
+            assert await service.chat([{"role": "user", "content": "hi"}], "", cache_key=key) == STUB_REPLY
+            assert server.request_count == 2
+            stats = service.answer_cache.stats()
+            assert stats["coalesced"] == 4 and stats["hits"] == 1, stats
+            await service.aclose()
+    asyncio.run(run())
+    print("✓ Identical questions share one upstream call and are then served from cache")
+
+
+if __name__ == "__main__":
+    test_retries_on_429_and_5xx()
+    test_reuses_connection()
+    test_circuit_breaker_fails_fast_and_recovers()
+    test_stream_yields_deltas()
+    test_stream_without_done_raises()
+    test_answer_cache_coalesces_identical_questions()
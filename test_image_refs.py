@@ -0,0 +1,146 @@
+"""
+图片引用计数并发测试
+
+在配置的 PostgreSQL 数据库上运行，测试数据提交后在结束时删除。同一个商品
+上并发上传、删除图片之后，确认：
+- 并发上传不会丢失任何一批图片；
+- image_blobs.ref_count 始终等于 image_paths 中对该图片的引用数；
+- 仍被引用的图片文件存在，不再被引用的图片文件已删除。
+
+    python test_image_refs.py
+"""
+import asyncio
+import io
+import os
+import random
+import uuid
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+from sqlalchemy import delete, select
+from app.config import settings
+from app.database import SessionLocal, AsyncSessionLocal
+from app.models import User, UserRole, Merchant, Product, ProductStatus, ImageBlob
+from app.api.upload import upload_product_images, delete_product_image
+from app.api.products import delete_product
+from app.services import image_variants
+
+CONCURRENCY = 6
+
+
+def create_fixture():
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        seller = User(username=f"img_seller_{tag}", email=f"img_seller_{tag}@example.com",
+                      password_hash="x", role=UserRole.MERCHANT)
+        db.add(seller)
+        db.flush()
+        merchant = Merchant(user_id=seller.id, shop_name=f"img_shop_{tag}")
+        db.add(merchant)
+        db.flush()
+        product = Product(merchant_id=merchant.id, name=f"img_product_{tag}", price=1.0,
+                          image_paths=[], status=ProductStatus.ONLINE)
+        db.add(product)
+        db.commit()
+        return seller.id, merchant.id, product.id
+
+
+def remove_fixture(seller_id, merchant_id, product_id):
+    with SessionLocal() as db:
+        seller = db.get(User, seller_id)
+        try:
+            delete_product(product_id, current_user=seller, db=db)  # 释放图片引用
+        except HTTPException:
+            pass
+    with SessionLocal() as db:
+        db.execute(delete(Merchant).where(Merchant.id == merchant_id))
+        db.execute(delete(User).where(User.id == seller_id))
+        db.commit()
+
+
+def random_png() -> bytes:
+    color = tuple(random.randrange(256) for _ in range(3))
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def upload(seller_id, product_id, content: bytes):
+    async with AsyncSessionLocal() as db:
+        seller = await db.get(User, seller_id)
+        files = [UploadFile(io.BytesIO(content), filename="image.png")]
+        result = await upload_product_images(product_id, files=files, current_user=seller, db=db)
+        return result["image_paths"][0]
+
+
+def remove(seller_id, product_id, path):
+    with SessionLocal() as db:
+        try:
+            delete_product_image(product_id, path, current_user=db.get(User, seller_id), db=db)
+            return 200
+        except HTTPException as e:
+            return e.status_code
+
+
+def check_references(product_id, paths):
+    """ref_count of every path matches its occurrences; files exist only while referenced"""
+    with SessionLocal() as db:
+        image_paths = db.get(Product, product_id).image_paths
+        for path in set(paths):
+            references = image_paths.count(path)
+            blob = db.execute(select(ImageBlob).where(ImageBlob.path == path)).scalar_one_or_none()
+            ref_count = blob.ref_count if blob else 0
+            assert ref_count == references, f"{path}: ref_count {ref_count}, {references} references"
+            exists = os.path.exists(os.path.join(settings.UPLOAD_DIR, path))
+            assert exists == (references > 0), f"{path}: file exists={exists}, {references} references"
+        return image_paths
+
+
+async def test_concurrent_uploads_keep_every_image():
+    fixture = create_fixture()
+    seller_id, _, product_id = fixture
+    try:
+        contents = [random_png(), random_png()]
+        paths = await asyncio.gather(*(
+            upload(seller_id, product_id, contents[i % 2]) for i in range(CONCURRENCY)
+        ))
+        image_paths = check_references(product_id, paths)
+        assert len(image_paths) == CONCURRENCY, image_paths
+        print(f"✓ {CONCURRENCY} concurrent uploads: every image kept, ref counts match")
+    finally:
+        remove_fixture(*fixture)
+
+
+async def test_upload_racing_delete_keeps_counts_consistent():
+    fixture = create_fixture()
+    seller_id, _, product_id = fixture
+    try:
+        content = random_png()
+        path = await upload(seller_id, product_id, content)
+        results = await asyncio.gather(
+            *(upload(seller_id, product_id, content) for _ in range(CONCURRENCY)),
+            *(asyncio.to_thread(remove, seller_id, product_id, path) for _ in range(CONCURRENCY)),
+        )
+        assert set(results[CONCURRENCY:]) <= {200, 404}, results
+        check_references(product_id, [path])
+        # 最后一次删除之后文件也随之删除
+        if remove(seller_id, product_id, path) == 200:
+            check_references(product_id, [path])
+        print("✓ Uploads racing deletes of the same image keep ref counts and files consistent")
+    finally:
+        remove_fixture(*fixture)
+
+
+async def main():
+    try:
+        await test_concurrent_uploads_keep_every_image()
+        await test_upload_racing_delete_keeps_counts_consistent()
+    finally:
+        image_variants.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f"✗ Image reference regression: {e}")
+        raise
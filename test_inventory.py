@@ -0,0 +1,192 @@
+"""
+库存正确性测试
+
+在配置的 PostgreSQL 数据库上运行，测试数据提交后在结束时删除：
+- 多个事务同时扣减同一个商品，恰好卖完，不超卖；
+- 单个分片不够时从多个分片凑数量，总数不足返回 409；
+- 预留了库存、商家超时未处理的订单被取消，库存归还、货款退回；
+- 没有预留库存或已被商家处理的订单不会被超时清理，取消时也不会多出库存；
+- 包含其他商家商品的订单不能由一个商家取消。
+
+超时清理只针对测试数据中的订单，不影响库里的其他订单。
+
+    python test_inventory.py
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Order, OrderStatus, User
+from app.schemas import OrderCreate, OrderStatusUpdate
+from app.api.orders import create_order, update_order_status
+from app.services import inventory
+from test_checkout import create_fixture, remove_fixture, checkout, BALANCE, PRICE
+
+STOCK = 10
+ATTEMPTS = 30
+
+
+def set_stock(product_id, quantity):
+    with SessionLocal() as db:
+        inventory.set_stock(db, product_id, quantity)
+        db.commit()
+
+
+def stock(product_id):
+    with SessionLocal() as db:
+        return inventory.get_stock(db, product_id)
+
+
+def reserve(product_id, quantity):
+    with SessionLocal() as db:
+        try:
+            inventory.reserve(db, {product_id: quantity})
+        except HTTPException as e:
+            return e.status_code
+        db.commit()
+        return 200
+
+
+def test_concurrent_reservations_never_oversell():
+    fixture = create_fixture()
+    product_id = fixture[3]
+    try:
+        set_stock(product_id, STOCK)
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda _: reserve(product_id, 1), range(ATTEMPTS)))
+        assert results.count(200) == STOCK and results.count(409) == ATTEMPTS - STOCK, results
+        assert stock(product_id) == 0
+        print(f"✓ {ATTEMPTS} concurrent reservations on {STOCK} units: sold out exactly")
+    finally:
+        remove_fixture(*fixture)
+
+
+def test_reservation_spans_shards():
+    fixture = create_fixture()
+    product_id = fixture[3]
+    try:
+        set_stock(product_id, settings.INVENTORY_SHARDS)  # 每个分片 1 件
+        assert reserve(product_id, 5) == 200
+        assert stock(product_id) == settings.INVENTORY_SHARDS - 5
+        assert reserve(product_id, settings.INVENTORY_SHARDS) == 409
+        assert stock(product_id) == settings.INVENTORY_SHARDS - 5
+        assert stock(fixture[3] + 10**9) is None  # 不存在的商品不限库存
+        print("✓ Reservations larger than a shard draw from several; shortfalls are refused")
+    finally:
+        remove_fixture(*fixture)
+
+
+def expire(order_id):
+    """Backdate an order so that its reservation, if any, has run out"""
+    with SessionLocal() as db:
+        order = db.get(Order, order_id)
+        order.created_at = datetime.utcnow() - timedelta(days=30)
+        if order.reserved_until is not None:
+            order.reserved_until = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+
+
+def sweep(buyer_id):
+    """Run the sweeper's query and cancellation, limited to the buyer's orders"""
+    with SessionLocal() as db:
+        expired = inventory.expired_reservations().where(Order.user_id == buyer_id)
+        cancelled = inventory.cancel_orders(db, expired, [OrderStatus.PENDING_PAYMENT])
+        db.commit()
+        return cancelled
+
+
+def test_expired_reservation_is_released():
+    fixture = create_fixture()
+    buyer_id, _, _, product_id = fixture
+    try:
+        set_stock(product_id, 3)
+        order = checkout(buyer_id, product_id, quantity=2)
+        assert stock(product_id) == 1
+        assert checkout(buyer_id, product_id, quantity=2) == 409
+
+        assert sweep(buyer_id) == []  # 还没到期
+        expire(order["id"])
+        assert sweep(buyer_id) == [order["id"]]
+
+        with SessionLocal() as db:
+            assert db.get(Order, order["id"]).status == OrderStatus.CANCELLED
+            assert db.get(User, buyer_id).balance == BALANCE
+        assert stock(product_id) == 3
+        print("✓ Orders whose reservation expired are cancelled, restocked and refunded")
+    finally:
+        remove_fixture(*fixture)
+
+
+def test_unreserved_order_is_left_alone():
+    fixture = create_fixture()
+    buyer_id, seller_id, _, product_id = fixture
+    try:
+        # 设置库存之前下的订单没有预留库存：不会被清理，取消时也不归还库存
+        legacy = checkout(buyer_id, product_id, quantity=2)
+        set_stock(product_id, 5)
+        expire(legacy["id"])
+        assert sweep(buyer_id) == []
+        with SessionLocal() as db:
+            assert inventory.cancel_orders(db, [legacy["id"]], [OrderStatus.PENDING_PAYMENT]) == [legacy["id"]]
+            db.commit()
+            assert db.get(User, buyer_id).balance == BALANCE
+        assert stock(product_id) == 5
+
+        # 商家处理过的订单，预留的库存已售出，不再参与清理
+        accepted = checkout(buyer_id, product_id, quantity=1)
+        with SessionLocal() as db:
+            update_order_status(accepted["id"], OrderStatusUpdate(status=OrderStatus.PENDING_SHIPMENT),
+                                current_user=db.get(User, seller_id), db=db)
+        expire(accepted["id"])
+        assert sweep(buyer_id) == []
+        assert stock(product_id) == 4
+        print("✓ Orders without a live reservation are never swept or restocked")
+    finally:
+        remove_fixture(*fixture)
+
+
+def test_merchant_cannot_cancel_shared_order():
+    ours, theirs = create_fixture(), create_fixture()
+    buyer_id, seller_id, _, product_id = ours
+    try:
+        set_stock(product_id, 5)
+        set_stock(theirs[3], 5)
+        with SessionLocal() as db:
+            order_data = OrderCreate(items=[
+                {"product_id": product_id, "quantity": 1},
+                {"product_id": theirs[3], "quantity": 1},
+            ])
+            response = create_order(order_data=order_data, idempotency_key=None,
+                                    current_user=db.get(User, buyer_id), db=db)
+            order_id = json.loads(response.body)["id"]
+
+        # 订单中还有别的商家的商品：不能由一个商家取消整单
+        with SessionLocal() as db:
+            try:
+                update_order_status(order_id, OrderStatusUpdate(status=OrderStatus.CANCELLED),
+                                    current_user=db.get(User, seller_id), db=db)
+            except HTTPException as e:
+                assert e.status_code == 403, e.status_code
+            else:
+                raise AssertionError("one merchant cancelled a shared order")
+            assert db.get(Order, order_id).status == OrderStatus.PENDING_PAYMENT
+            assert db.get(User, buyer_id).balance == BALANCE - 2 * PRICE
+        assert stock(product_id) == 4 and stock(theirs[3]) == 4
+        print("✓ A merchant cannot cancel, refund or restock an order shared with another merchant")
+    finally:
+        remove_fixture(*ours)
+        remove_fixture(*theirs)
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_reservations_never_oversell()
+        test_reservation_spans_shards()
+        test_expired_reservation_is_released()
+        test_unreserved_order_is_left_alone()
+        test_merchant_cannot_cancel_shared_order()
+    except AssertionError as e:
+        print(f"✗ Inventory regression: {e}")
+        raise
@@ -0,0 +1,162 @@
+"""
+订单接口查询次数回归测试
+
+在配置的 PostgreSQL 数据库上运行（所有数据在事务中创建并最终回滚），
+确认订单接口的 SQL 查询数量不随订单数量增长（防止 N+1 查询回归）。
+
+    python test_order_queries.py
+"""
+from contextlib import contextmanager
+from fastapi import HTTPException, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.database import engine
+from app.models import User, UserRole, Merchant, Product, ProductStatus, Order, OrderItem, OrderStatus
+from app.schemas import OrderStatusUpdate
+from app.api.orders import get_my_orders, get_merchant_orders, update_order_status
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor
+
+# 订单数量从 1 增长到 MANY_ORDERS 时，查询数量必须保持不变
+MANY_ORDERS = 25
+ITEMS_PER_ORDER = 3
+
+
+@contextmanager
+def rollback_session():
+    """Session bound to an outer transaction that is always rolled back"""
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@contextmanager
+def count_queries(session: Session):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(("SAVEPOINT", "RELEASE", "ROLLBACK")):
+            statements.append(statement)
+
+    connection = session.connection()
+    event.listen(connection, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(connection, "before_cursor_execute", before_cursor_execute)
+
+
+def create_fixture(session: Session, order_count: int, tag: str):
+    buyer = User(username=f"qc_buyer_{tag}", email=f"qc_buyer_{tag}@example.com",
+                 password_hash="x", role=UserRole.USER)
+    seller = User(username=f"qc_seller_{tag}", email=f"qc_seller_{tag}@example.com",
+                  password_hash="x", role=UserRole.MERCHANT)
+    session.add_all([buyer, seller])
+    session.flush()
+
+    merchant = Merchant(user_id=seller.id, shop_name=f"qc_shop_{tag}")
+    session.add(merchant)
+    session.flush()
+
+    products = [
+        Product(merchant_id=merchant.id, name=f"qc_product_{tag}_{i}", price=100.0 + i,
+                image_paths=[f"products/{i}/a.jpg"], status=ProductStatus.ONLINE)
+        for i in range(ITEMS_PER_ORDER)
+    ]
+    session.add_all(products)
+    session.flush()
+
+    orders = []
+    for _ in range(order_count):
+        order = Order(user_id=buyer.id, total_price=0, status=OrderStatus.PENDING_PAYMENT)
+        order.items = [
+            OrderItem(product_id=product.id, merchant_id=merchant.id, quantity=1,
+                      price_at_purchase=product.price)
+            for product in products
+        ]
+        orders.append(order)
+    session.add_all(orders)
+    session.commit()
+    session.expire_all()
+    return buyer, seller, orders
+
+
+def measure(endpoint, order_count: int) -> int:
+    with rollback_session() as session:
+        buyer, seller, orders = create_fixture(session, order_count, f"{endpoint.__name__}_{order_count}")
+        with count_queries(session) as statements:
+            if endpoint is get_my_orders:
+                result = get_my_orders(current_user=buyer, db=session)
+                assert len(result) == order_count
+                assert all(len(order.items) == ITEMS_PER_ORDER for order in result)
+            elif endpoint is get_merchant_orders:
+                result = get_merchant_orders(response=Response(), status_filter=None, limit=100,
+                                             cursor=None, current_user=seller, db=session)
+                assert len(result) == order_count
+                assert all(item.product_name for order in result for item in order.items)
+            else:
+                result = update_order_status(
+                    order_id=orders[0].id,
+                    status_update=OrderStatusUpdate(status=OrderStatus.SHIPPED),
+                    current_user=seller,
+                    db=session,
+                )
+                assert len(result.items) == ITEMS_PER_ORDER
+        return len(statements)
+
+
+def test_order_endpoints_query_count_is_constant():
+    for endpoint in (get_my_orders, get_merchant_orders, update_order_status):
+        few = measure(endpoint, 1)
+        many = measure(endpoint, MANY_ORDERS)
+        assert few == many, f"{endpoint.__name__}: {few} queries for 1 order, {many} for {MANY_ORDERS}"
+        print(f"✓ {endpoint.__name__}: {many} queries for {MANY_ORDERS} orders")
+
+
+def test_merchant_order_feed_pages_and_filters():
+    with rollback_session() as session:
+        buyer, seller, orders = create_fixture(session, 5, "feed")
+        for order in orders[:2]:
+            order.status = OrderStatus.SHIPPED
+        session.commit()
+
+        def feed(status_filter=None, limit=100, cursor=None):
+            response = Response()
+            result = get_merchant_orders(response=response, status_filter=status_filter, limit=limit,
+                                         cursor=cursor, current_user=seller, db=session)
+            return result, response.headers.get(NEXT_CURSOR_HEADER)
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = feed(limit=2, cursor=cursor)
+            seen.extend(order.id for order in page)
+            if cursor is None:
+                break
+        assert seen == sorted((order.id for order in orders), reverse=True), seen
+
+        shipped, _ = feed(status_filter=OrderStatus.SHIPPED)
+        assert sorted(order.id for order in shipped) == sorted(order.id for order in orders[:2])
+
+        # 篡改过的游标返回 400，而不是在 SQL 比较时出错
+        for tampered in (encode_cursor(["x"]), encode_cursor([True]), encode_cursor([1, 2]), "%%%"):
+            try:
+                feed(cursor=tampered)
+            except HTTPException as e:
+                assert e.status_code == 400, e.status_code
+            else:
+                raise AssertionError(f"cursor {tampered!r} was accepted")
+        print("✓ get_merchant_orders: keyset pages newest first, filters by status, rejects bad cursors")
+
+
+if __name__ == "__main__":
+    try:
+        test_order_endpoints_query_count_is_constant()
+        test_merchant_order_feed_pages_and_filters()
+    except AssertionError as e:
+        print(f"✗ Query count regression: {e}")
+        raise
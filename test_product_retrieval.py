@@ -0,0 +1,52 @@
+"""
+聊天商品检索测试：不需要数据库，直接在内存中构造商品目录。
+
+    python test_product_retrieval.py
+"""
+from app.services.product_retrieval import ProductEntry, ProductIndex, estimate_tokens
+
+
+def make_catalog(size):
+    products = [
+        ProductEntry(1, "北欧实木床", "白橡木框架，1.8米双人床", 2899.0),
+        ProductEntry(2, "布艺沙发", "三人位，可拆洗", 3599.0),
+        ProductEntry(3, "Oak dining table", "Solid oak, seats six", 1999.0),
+    ]
+    products += [
+        ProductEntry(100 + i, f"餐椅 {i} 号", "金属腿，软包坐垫", 299.0)
+        for i in range(size)
+    ]
+    return ProductIndex(products)
+
+
+def test_picks_relevant_products():
+    index = make_catalog(5000)
+    selected = [index.products[p].id for p in index.select("有没有三千以内的实木床？", top_k=5, token_budget=2000)]
+    assert selected[0] == 1, selected
+    selected = [index.products[p].id for p in index.select("looking for an oak table", top_k=5, token_budget=2000)]
+    assert selected[0] == 3, selected
+    print("✓ Ranks the products matching the question first")
+
+
+def test_context_bounded_by_k_and_budget():
+    for size in (10, 5000):
+        index = make_catalog(size)
+        context = index.render("餐椅", top_k=20, token_budget=300)
+        lines = context.splitlines()[1:]
+        assert len(lines) <= 20, len(lines)
+        assert sum(estimate_tokens(line + "\n") for line in lines) <= 300, context
+    print("✓ Prompt context stays within top-k and the token budget regardless of catalog size")
+
+
+def test_small_catalog_and_no_match():
+    index = make_catalog(0)
+    context = index.render("hello", top_k=20, token_budget=2000)
+    assert context.startswith("Available products:\n") and context.count("\n") == 4, context
+    assert ProductIndex([]).render("床", top_k=20, token_budget=2000) == "No products available."
+    print("✓ Small catalogs are sent whole; unmatched questions still get products")
+
+
+if __name__ == "__main__":
+    test_picks_relevant_products()
+    test_context_bounded_by_k_and_budget()
+    test_small_catalog_and_no_match()
@@ -0,0 +1,114 @@
+"""
+热点查询索引回归测试
+
+在配置的 PostgreSQL 数据库上运行（需先执行 python migrate.py），对接口实际
+发出的查询运行 EXPLAIN，确认执行计划用到了 migrations/ 中建立的索引。
+开发库数据很少，顺序扫描和显式排序总是更便宜，因此在事务内把它们关掉：
+只要查询能用上索引（分页查询还要按索引顺序读取），计划中就一定会出现它。
+
+    python test_query_plans.py
+"""
+import json
+from datetime import datetime
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from app.database import engine
+from app.models import (
+    Product, ProductStatus, Order, OrderItem, OrderStatus, CartItem, ChatHistory,
+)
+from app.services.search_index import build_tsquery
+
+def hot_queries():
+    """(description, statement, acceptable indexes) for the queries the API runs most"""
+    return [
+        ("product list page",
+         select(Product).order_by(Product.created_at.desc(), Product.id.desc()).limit(20),
+         "ix_products_created_at_id"),
+        ("online product list page",
+         select(Product).where(Product.status == ProductStatus.ONLINE)
+         .order_by(Product.created_at.desc(), Product.id.desc()).limit(20),
+         # 大部分商品在售时，按时间索引读取并过滤状态同样只读一页
+         ("ix_products_status_created_at_id", "ix_products_created_at_id")),
+        ("search by category and price",
+         select(Product).where(
+             Product.status == ProductStatus.ONLINE,
+             Product.category_id == 1,
+             Product.price >= 100,
+             Product.price <= 500,
+         ),
+         "ix_products_status_category_price"),
+        ("keyword search",
+         select(Product).where(Product.search_vector.op("@@")(build_tsquery("沙发"))),
+         "ix_products_search_vector"),
+        ("merchant products",
+         select(Product).where(Product.merchant_id == 1),
+         "ix_products_merchant_id"),
+        ("my orders",
+         select(Order).where(Order.user_id == 1).order_by(Order.created_at.desc()),
+         "ix_orders_user_created"),
+        ("expired reservations",
+         select(Order.id).where(
+             Order.status == OrderStatus.PENDING_PAYMENT,
+             Order.reserved_until < datetime(2020, 1, 1),
+         ).order_by(Order.reserved_until).limit(100),
+         "ix_orders_status_reserved_until"),
+        ("order items of orders",
+         select(OrderItem).where(OrderItem.order_id.in_([1, 2, 3])),
+         "ix_order_items_order_id"),
+        ("order lines of a product",
+         select(OrderItem).where(OrderItem.product_id == 1),
+         "ix_order_items_product_id"),
+        ("merchant order feed",
+         select(OrderItem.order_id).where(OrderItem.merchant_id == 1, OrderItem.order_id < 1000)
+         .distinct().order_by(OrderItem.order_id.desc()).limit(21),
+         "ix_order_items_merchant_order"),
+        ("cart item lookup",
+         select(CartItem).where(CartItem.cart_id == 1, CartItem.product_id == 1),
+         "uq_cart_items_cart_product"),
+        ("chat memory",
+         select(ChatHistory).where(
+             ChatHistory.user_id == 1,
+             ChatHistory.merchant_id == 1,
+             ChatHistory.id > 0,
+         ).order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()),
+         "ix_chat_history_user_merchant_created"),
+    ]
+
+def index_names(plan) -> set:
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= index_names(child)
+    return names
+
+def explain(conn, statement) -> set:
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    result = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql)).scalar_one()
+    plan = result if isinstance(result, list) else json.loads(result)
+    return index_names(plan[0]["Plan"])
+
+def test_hot_queries_use_indexes():
+    failures = []
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            conn.execute(text("SET LOCAL enable_sort = off"))
+            for description, statement, expected in hot_queries():
+                expected = (expected,) if isinstance(expected, str) else expected
+                used = explain(conn, statement)
+                matched = [name for name in expected if name in used]
+                if matched:
+                    print(f"✓ {description}: {matched[0]}")
+                else:
+                    failures.append(
+                        f"{description}: expected {' or '.join(expected)}, plan uses {sorted(used) or 'no index'}"
+                    )
+    assert not failures, "; ".join(failures)
+
+if __name__ == "__main__":
+    try:
+        test_hot_queries_use_indexes()
+    except AssertionError as e:
+        print(f"✗ Missing index usage: {e}")
+        raise
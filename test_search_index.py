@@ -0,0 +1,48 @@
+"""
+商品全文检索分词测试：不需要数据库，只检查写入索引的词条和构造的 tsquery。
+
+    python test_search_index.py
+"""
+from app.services.search_index import document_terms, query_terms, build_tsquery
+
+
+def tsquery_text(text):
+    query = build_tsquery(text)
+    return None if query is None else query.clause.value
+
+
+def test_cjk_unigrams_and_bigrams():
+    assert document_terms("北欧实木床") == ["北", "欧", "实", "木", "床", "北欧", "欧实", "实木", "木床"]
+    # 查询只用二元组（单字用一元），等价于原文中的子串匹配
+    assert query_terms("实木床") == ["实木", "木床"]
+    assert query_terms("床") == ["床"]
+    assert set(query_terms("北欧实木床")) <= set(document_terms("北欧实木床"))
+    assert tsquery_text("实木床") == "'实木' & '木床'"
+    print("✓ CJK text is indexed as unigrams and bigrams and queried by bigrams")
+
+
+def test_latin_words_match_as_prefixes():
+    assert document_terms("Solid OAK Table") == ["solid", "oak", "table"]
+    # 全角字母数字折叠为半角
+    assert document_terms("ＯＡＫ") == ["oak"]
+    assert tsquery_text("Oak tab") == "'oak':* & 'tab':*"
+    assert tsquery_text("O'Brien") == "'o':* & 'brien':*"
+    assert tsquery_text("，！ ") is None
+    print("✓ Latin words are lowercased, normalized and matched as prefixes")
+
+
+def test_mixed_query():
+    assert query_terms("1.8米床") == ["1", "8", "米床"]
+    assert document_terms("1.8米床") == ["1", "8", "米", "床", "米床"]
+    assert tsquery_text("1.8米床") == "'1':* & '8':* & '米床'"
+    print("✓ Mixed CJK and number queries require every term")
+
+
+if __name__ == "__main__":
+    try:
+        test_cjk_unigrams_and_bigrams()
+        test_latin_words_match_as_prefixes()
+        test_mixed_query()
+    except AssertionError as e:
+        print(f"✗ Search index regression: {e}")
+        raise